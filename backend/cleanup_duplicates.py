@@ -97,6 +97,7 @@ class DuplicateCleaner:
         
         print(f"📦 Encontrados {len(duplicates)} grupos de productos duplicados")
         
+        ids_to_delete = []
         for duplicate_group in duplicates:
             name = duplicate_group['_id']
             products = duplicate_group['products']
@@ -104,16 +105,19 @@ class DuplicateCleaner:
             # Elegir el mejor producto
             best_product = self.choose_best_product(products)
             
-            # Eliminar los otros productos
+            # Marcar los otros productos para eliminar
             for product in products:
                 if product['id'] != best_product['id']:
-                    try:
-                        result = await self.db.products.delete_one({"id": product['id']})
-                        if result.deleted_count > 0:
-                            self.deleted_count += 1
-                            print(f"   ❌ Eliminado duplicado: ${product.get('retail_price', 0):,}")
-                    except Exception as e:
-                        print(f"   ⚠️ Error eliminando {product['id']}: {str(e)}")
+                    ids_to_delete.append(product['id'])
+                    print(f"   ❌ Duplicado a eliminar: ${product.get('retail_price', 0):,}")
+        
+        # Eliminar todos los duplicados en un solo viaje a la base de datos
+        if ids_to_delete:
+            try:
+                result = await self.db.products.delete_many({"id": {"$in": ids_to_delete}})
+                self.deleted_count += result.deleted_count
+            except Exception as e:
+                print(f"   ⚠️ Error eliminando duplicados: {str(e)}")
         
         print("\n" + "=" * 60)
         print("🎉 LIMPIEZA COMPLETADA")
@@ -5,10 +5,10 @@ Migra todas las imágenes de PostImg a ImgBB automáticamente
 """
 
 import asyncio
-import aiohttp
 import base64
 import os
 import sys
+import httpx
 from motor.motor_asyncio import AsyncIOMotorClient
 from urllib.parse import urlparse
 import re
@@ -24,8 +24,10 @@ MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
 DB_NAME = os.environ.get('DB_NAME', 'test_database')
 
 class ImageMigrator:
-    def __init__(self):
+    def __init__(self, transport=None):
         self.client = AsyncIOMotorClient(MONGO_URL)
+        # httpx transport para las descargas y ImgBB; benchmarks/fake_upstreams.py provee uno falso
+        self.transport = transport
         self.db = self.client[DB_NAME]
         self.migrated_count = 0
         self.failed_count = 0
@@ -40,17 +42,17 @@ class ImageMigrator:
     async def download_image(self, session, url):
         """Descarga una imagen desde PostImg"""
         try:
-            async with session.get(url, timeout=30) as response:
-                if response.status == 200:
-                    content = await response.read()
-                    if len(content) > 0:
-                        return content
-                    else:
-                        print(f"   ❌ Imagen vacía: {url}")
-                        return None
+            response = await session.get(url, timeout=30)
+            if response.status_code == 200:
+                content = response.content
+                if len(content) > 0:
+                    return content
                 else:
-                    print(f"   ❌ Error HTTP {response.status}: {url}")
+                    print(f"   ❌ Imagen vacía: {url}")
                     return None
+            else:
+                print(f"   ❌ Error HTTP {response.status_code}: {url}")
+                return None
         except Exception as e:
             print(f"   ❌ Error descargando {url}: {str(e)}")
             return None
@@ -68,19 +70,19 @@ class ImageMigrator:
                 'name': name
             }
             
-            async with session.post('https://api.imgbb.com/1/upload', data=data, timeout=30) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    if result.get('success'):
-                        new_url = result['data']['url']
-                        print(f"   ✅ Subida exitosa: {new_url}")
-                        return new_url
-                    else:
-                        print(f"   ❌ Error en respuesta de ImgBB: {result}")
-                        return None
+            response = await session.post('https://api.imgbb.com/1/upload', data=data, timeout=30)
+            if response.status_code == 200:
+                result = response.json()
+                if result.get('success'):
+                    new_url = result['data']['url']
+                    print(f"   ✅ Subida exitosa: {new_url}")
+                    return new_url
                 else:
-                    print(f"   ❌ Error HTTP ImgBB {response.status}")
+                    print(f"   ❌ Error en respuesta de ImgBB: {result}")
                     return None
+            else:
+                print(f"   ❌ Error HTTP ImgBB {response.status_code}")
+                return None
         except Exception as e:
             print(f"   ❌ Error subiendo a ImgBB: {str(e)}")
             return None
@@ -203,8 +205,7 @@ class ImageMigrator:
             return
         
         # Crear sesión HTTP
-        timeout = aiohttp.ClientTimeout(total=60)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
+        async with httpx.AsyncClient(transport=self.transport, timeout=60, follow_redirects=True) as session:
             
             # Procesar cada producto
             products_updated = 0
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+HANNU CLOTHES - Migraciones versionadas de la colección de productos
+Convierte los productos en formatos heredados al formato actual, por lotes y reanudable
+
+Uso: python migrations.py [--batch-size 500] [--restart]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from models import Product
+from normalization import normalize_name_key, clean_product_fields
+
+BATCH_SIZE = 500
+
+# Defaults for every field the API returns, so migrated documents qualify for the read fast path
+PRODUCT_DEFAULTS = {
+    "description": "",
+    "image": "",
+    "images": [],
+    "colors": [],
+    "specifications": "",
+    "composition": "",
+    "care": "",
+    "shipping_policy": "",
+    "exchange_policy": "",
+    "sizes": [],
+    "stock": {},
+}
+
+class Migration:
+    def __init__(self, version: int, description: str, apply):
+        self.version = version
+        self.description = description
+        self.apply = apply  # product dict -> migrated product dict
+
+PRODUCT_MIGRATIONS = []
+
+def product_migration(version: int, description: str):
+    """Register a migration; versions must be added in increasing order and never renumbered"""
+    def register(apply):
+        if PRODUCT_MIGRATIONS and version <= PRODUCT_MIGRATIONS[-1].version:
+            raise ValueError(f"Migration {version} registered out of order")
+        PRODUCT_MIGRATIONS.append(Migration(version, description, apply))
+        return apply
+    return register
+
+@product_migration(1, "Convert legacy field shapes and fill missing fields")
+def normalize_legacy_shapes(product: dict) -> dict:
+    product = clean_product_fields(product)
+    for field, default in PRODUCT_DEFAULTS.items():
+        if product.get(field) is None:
+            product[field] = default.copy() if isinstance(default, (list, dict)) else default
+    now = datetime.utcnow()
+    product.setdefault("created_at", now)
+    product.setdefault("updated_at", product["created_at"] or now)
+    product["name_key"] = normalize_name_key(product.get("name", ""))
+    return product
+
+@product_migration(2, "Drop empty image URLs and derive the main image from images")
+def clean_images(product: dict) -> dict:
+    images = [image for image in product.get("images", []) if isinstance(image, str) and image.strip()]
+    if not images and product.get("image"):
+        images = [product["image"]]
+    product["images"] = images
+    if not product.get("image") and images:
+        product["image"] = images[0]
+    return product
+
+@product_migration(3, "Remove fields the API no longer reads (care_instructions, is_active)")
+def drop_unused_fields(product: dict) -> dict:
+    # care_instructions was copied into care by migration 1
+    product.pop("care_instructions", None)
+    # Only the default flag is dropped; an explicit is_active=False is kept for the record
+    if product.get("is_active") is True:
+        del product["is_active"]
+    return product
+
+@product_migration(4, "Validate every field through Product (coerce numeric strings, reject invalid documents)")
+def validate_product(product: dict) -> dict:
+    # Migrations 1-3 only reshaped documents, but the read fast path serves anything at the current
+    # version verbatim. Validation coerces what the old from_dict read path coerced ("150000" ->
+    # 150000, stock {"S": "3"} -> {"S": 3}) and raises on the rest, so the document keeps its
+    # previous version and stays on the validating read path. Extra fields are kept as they are.
+    product.update(Product.from_dict(product).model_dump())
+    product["name_key"] = normalize_name_key(product["name"])
+    return product
+
+PRODUCT_SCHEMA_VERSION = PRODUCT_MIGRATIONS[-1].version
+
+def product_to_document(product_obj: Product) -> dict:
+    """Convert a Product to the document stored in MongoDB, at the current schema version"""
+    product_doc = product_obj.model_dump()
+    product_doc["name_key"] = normalize_name_key(product_obj.name)
+    product_doc["schema_version"] = PRODUCT_SCHEMA_VERSION
+    return product_doc
+
+def migrate_document(product: dict, target_version: int = PRODUCT_SCHEMA_VERSION) -> dict:
+    """Apply every pending migration to a copy of the product, in order"""
+    current_version = product.get("schema_version", 0)
+    migrated = {key: value for key, value in product.items() if key != "_id"}
+    for migration in PRODUCT_MIGRATIONS:
+        if current_version < migration.version <= target_version:
+            migrated = migration.apply(migrated)
+    migrated["schema_version"] = max(current_version, target_version)
+    return migrated
+
+def migration_update(product: dict, migrated: dict) -> dict:
+    """$set/$unset document that turns the stored product into the migrated one"""
+    update = {}
+    changed = {key: value for key, value in migrated.items() if key not in product or product[key] != value}
+    removed = {key: "" for key in product if key != "_id" and key not in migrated}
+    if changed:
+        update["$set"] = changed
+    if removed:
+        update["$unset"] = removed
+    return update
+
+class MigrationRunner:
+    """Migrates products below the target version in _id order, saving progress after every batch"""
+
+    def __init__(self, db, target_version: int = PRODUCT_SCHEMA_VERSION, batch_size: int = BATCH_SIZE):
+        self.db = db
+        self.target_version = target_version
+        self.batch_size = batch_size
+        self.progress_id = "products"
+        self.last_id = None
+        self.processed_count = 0
+        self.migrated_count = 0
+        self.failed_count = 0
+
+    async def load_progress(self, restart: bool = False):
+        progress = await self.db.migrations.find_one({"_id": self.progress_id})
+        if (restart or not progress or progress.get("completed_at")
+                or progress.get("target_version") != self.target_version):
+            return
+        self.last_id = progress.get("last_id")
+        self.processed_count = progress.get("processed", 0)
+        self.migrated_count = progress.get("migrated", 0)
+        self.failed_count = progress.get("failed", 0)
+        print(f"↪️ Reanudando después de {self.processed_count} productos ya procesados")
+
+    async def save_progress(self, completed: bool = False):
+        progress = {
+            "target_version": self.target_version,
+            "last_id": self.last_id,
+            "processed": self.processed_count,
+            "migrated": self.migrated_count,
+            "failed": self.failed_count,
+            "updated_at": datetime.utcnow(),
+            "completed_at": datetime.utcnow() if completed else None,
+        }
+        await self.db.migrations.update_one({"_id": self.progress_id}, {"$set": progress}, upsert=True)
+
+    async def flush(self, products: list):
+        requests = []
+        requested = []
+        for product in products:
+            try:
+                update = migration_update(product, migrate_document(product, self.target_version))
+            except Exception as e:
+                self.failed_count += 1
+                print(f"   ❌ {product.get('name', product.get('id'))}: {str(e)}")
+                continue
+            # Match the version we read, so documents rewritten in the meantime at a newer version are skipped
+            requests.append(UpdateOne({"_id": product["_id"], "schema_version": product.get("schema_version")}, update))
+            requested.append(product)
+
+        if requests:
+            try:
+                result = await self.db.products.bulk_write(requests, ordered=False)
+                self.migrated_count += result.modified_count
+            except BulkWriteError as e:
+                # Los demás productos del lote sí se escribieron; se guarda el progreso igual
+                write_errors = e.details.get("writeErrors", [])
+                self.migrated_count += e.details.get("nModified", 0)
+                self.failed_count += len(write_errors)
+                for error in write_errors:
+                    product = requested[error["index"]]
+                    print(f"   ❌ {product.get('name', product.get('id'))}: {error.get('errmsg')}")
+        self.processed_count += len(products)
+        self.last_id = products[-1]["_id"]
+        await self.save_progress()
+
+    async def run(self, restart: bool = False):
+        await self.load_progress(restart)
+        print(f"🔄 MIGRANDO PRODUCTOS A LA VERSIÓN {self.target_version}")
+        print("=" * 60)
+        for migration in PRODUCT_MIGRATIONS:
+            if migration.version <= self.target_version:
+                print(f"   v{migration.version}: {migration.description}")
+
+        query = {"schema_version": {"$not": {"$gte": self.target_version}}}
+        if self.last_id is not None:
+            query["_id"] = {"$gt": self.last_id}
+
+        started = time.perf_counter()
+        processed_before = self.processed_count
+        batch = []
+        async for product in self.db.products.find(query).sort("_id", 1).batch_size(self.batch_size):
+            batch.append(product)
+            if len(batch) >= self.batch_size:
+                await self.flush(batch)
+                batch = []
+                elapsed = time.perf_counter() - started
+                print(f"   📦 {self.processed_count} procesados ({(self.processed_count - processed_before) / elapsed:.0f} docs/s)")
+        if batch:
+            await self.flush(batch)
+        await self.save_progress(completed=True)
+
+        elapsed = time.perf_counter() - started
+        processed = self.processed_count - processed_before
+        print("\n" + "=" * 60)
+        print("🎉 MIGRACIÓN COMPLETADA")
+        print("=" * 60)
+        print(f"📦 Productos procesados: {self.processed_count}")
+        print(f"✅ Productos migrados: {self.migrated_count}")
+        print(f"❌ Productos con errores: {self.failed_count}")
+        print(f"⏱️ {processed} productos en {elapsed:.2f}s ({processed / elapsed if elapsed else 0:.0f} docs/s)")
+
+async def main(args):
+    load_dotenv()
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    runner = MigrationRunner(client[os.environ.get('DB_NAME', 'test_database')], batch_size=args.batch_size)
+    await runner.run(restart=args.restart)
+    client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migra los productos al esquema actual")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--restart", action="store_true", help="Ignora el progreso guardado y empieza de nuevo")
+
+    print("HANNU CLOTHES - Migraciones de Productos")
+    print()
+
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,196 @@
+"""
+HANNU CLOTHES - Data models shared by the API server, the migrations and the scripts
+Importing this module has no side effects (no settings, no database connection)
+"""
+
+import uuid
+from datetime import datetime
+from typing import List, Optional, Dict, Union, Literal
+
+from passlib.context import CryptContext
+from pydantic import BaseModel, ConfigDict, Field, EmailStr, StrictFloat, StrictInt
+
+from normalization import clean_product_fields
+
+# Prices sent by the admin panel are JSON numbers; strict input models reject "15000" instead of coercing it
+Price = Union[StrictInt, StrictFloat]
+
+class Product(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: str
+    description: str = ""
+    retail_price: Union[int, float]  # Accept both int and float
+    wholesale_price: Union[int, float]  # Accept both int and float
+    category: str  # vestidos, enterizos, conjuntos, blusas, faldas, pantalones
+    image: str = ""  # Keep for backward compatibility, make optional
+    images: List[str] = Field(default_factory=list)  # Support multiple images
+    colors: List[str] = Field(default_factory=list)  # Support multiple colors
+    specifications: str = ""
+    composition: str = ""
+    care: str = ""
+    shipping_policy: str = ""
+    exchange_policy: str = ""
+    sizes: List[str] = Field(default_factory=list)
+    stock: Dict[str, int] = Field(default_factory=dict)  # size -> quantity
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    
+    @classmethod
+    def from_dict(cls, data: dict):
+        """Create Product from dict with data cleaning"""
+        return cls(**clean_product_fields(data))
+
+PRODUCT_FIELDS = tuple(Product.model_fields)
+PRODUCT_FIELD_SET = frozenset(PRODUCT_FIELDS)
+
+class ProductCreate(BaseModel):
+    model_config = ConfigDict(strict=True)
+
+    name: str
+    description: str
+    retail_price: Price
+    wholesale_price: Price
+    category: str
+    image: Optional[str] = ""  # Keep for backward compatibility
+    images: List[str] = Field(default_factory=list)  # Support multiple images
+    colors: List[str] = Field(default_factory=list)  # Support multiple colors
+    specifications: Optional[str] = ""
+    composition: Optional[str] = ""
+    care: Optional[str] = ""
+    shipping_policy: Optional[str] = ""
+    exchange_policy: Optional[str] = ""
+    sizes: List[str] = Field(default_factory=list)
+    stock: Optional[Dict[str, int]] = Field(default_factory=dict)
+
+class ProductUpdate(BaseModel):
+    model_config = ConfigDict(strict=True)
+
+    name: Optional[str] = None
+    description: Optional[str] = None
+    retail_price: Optional[Price] = None
+    wholesale_price: Optional[Price] = None
+    category: Optional[str] = None
+    image: Optional[str] = None  # Keep for backward compatibility
+    images: Optional[List[str]] = None  # Support multiple images
+    colors: Optional[List[str]] = None  # Support multiple colors
+    specifications: Optional[str] = None
+    composition: Optional[str] = None
+    care: Optional[str] = None
+    shipping_policy: Optional[str] = None
+    exchange_policy: Optional[str] = None
+    sizes: Optional[List[str]] = None
+    stock: Optional[Dict[str, int]] = None
+
+class Admin(BaseModel):
+    model_config = ConfigDict(strict=True)
+
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    username: str
+    email: EmailStr
+    password_hash: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    is_active: bool = True
+    role: str = "admin"
+    token_version: int = 0  # bumped to revoke every token issued so far
+
+class AdminPrincipal(BaseModel):
+    """Authenticated admin as described by the token claims"""
+    id: str
+    username: str
+    role: str = "admin"
+    token_version: int = 0
+
+class AdminCreate(BaseModel):
+    username: str
+    email: EmailStr
+    password: str
+
+class AdminLogin(BaseModel):
+    username: str
+    password: str
+
+class PasswordChange(BaseModel):
+    current_password: str
+    new_password: str
+
+class Token(BaseModel):
+    access_token: str
+    token_type: str
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None  # access token lifetime in seconds
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class CatalogStats(BaseModel):
+    total_products: int
+    products_by_category: Dict[str, int]
+    total_stock_value_retail: Union[int, float]  # float prices make the totals non-integral
+    total_stock_value_wholesale: Union[int, float]
+    low_stock_products: List[str]
+
+class StockUpdate(BaseModel):
+    model_config = ConfigDict(strict=True)
+
+    size: str
+    quantity: int
+
+class StockReservation(BaseModel):
+    model_config = ConfigDict(strict=True)
+
+    size: str
+    quantity: int = Field(gt=0)
+
+class StockReservationLine(StockReservation):
+    product_id: str
+
+class StockBatchReservation(BaseModel):
+    lines: List[StockReservationLine]
+
+class BulkProductOperation(BaseModel):
+    action: Literal["create", "update", "upsert", "delete"]
+    id: Optional[str] = None  # required for update/delete; optional match key for upsert
+    product: Optional[ProductCreate] = None  # full product for create/upsert
+    changes: Optional[ProductUpdate] = None  # partial changes for update
+
+class BulkProductRequest(BaseModel):
+    operations: List[BulkProductOperation]
+
+class BulkItemResult(BaseModel):
+    index: int
+    action: str
+    id: Optional[str] = None
+    status: str  # success or error
+    status_code: Optional[int] = None  # HTTP status the single-product endpoint would return on error
+    message: str = ""
+
+class BulkProductResult(BaseModel):
+    total_operations: int
+    created: int
+    updated: int
+    deleted: int
+    failed: int
+    results: List[BulkItemResult]
+
+class ImportRowError(BaseModel):
+    row: int
+    name: str = ""
+    message: str
+
+class CatalogImportResult(BaseModel):
+    total_rows: int
+    created: int
+    updated: int
+    unchanged: int
+    failed: int
+    dry_run: bool
+    errors: List[ImportRowError]
+
+# Passwords
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
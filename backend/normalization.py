@@ -0,0 +1,70 @@
+"""
+HANNU CLOTHES - Normalization helpers for product documents
+Shared by every writer so all of them store the same derived fields
+"""
+
+import unicodedata
+
+
+def normalize_name_key(name: str) -> str:
+    """Casefolded, accent-stripped, whitespace-collapsed product name used for exact lookups"""
+    decomposed = unicodedata.normalize("NFKD", name or "")
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(stripped.casefold().split())
+
+
+def clean_product_fields(data: dict) -> dict:
+    """Copy of a stored product with legacy field shapes converted to what Product expects"""
+    # Clean up the data to handle inconsistencies
+    cleaned_data = data.copy()
+    
+    # Remove MongoDB _id field if present
+    if '_id' in cleaned_data:
+        del cleaned_data['_id']
+    
+    # Ensure image field exists
+    if 'image' not in cleaned_data:
+        cleaned_data['image'] = ""
+    
+    # Handle colors field - convert empty string to empty list
+    if 'colors' in cleaned_data:
+        if isinstance(cleaned_data['colors'], str):
+            if cleaned_data['colors'].strip():
+                cleaned_data['colors'] = [c.strip() for c in cleaned_data['colors'].split(',') if c.strip()]
+            else:
+                cleaned_data['colors'] = []
+    
+    # Handle sizes field - convert empty string to empty list
+    if 'sizes' in cleaned_data:
+        if isinstance(cleaned_data['sizes'], str):
+            if cleaned_data['sizes'].strip():
+                cleaned_data['sizes'] = [s.strip() for s in cleaned_data['sizes'].split(',') if s.strip()]
+            else:
+                cleaned_data['sizes'] = []
+    
+    # Handle images field - ensure it's a list
+    if 'images' in cleaned_data:
+        if isinstance(cleaned_data['images'], str):
+            if cleaned_data['images'].strip():
+                cleaned_data['images'] = [cleaned_data['images']]
+            else:
+                cleaned_data['images'] = []
+    
+    # Ensure description exists
+    if 'description' not in cleaned_data:
+        cleaned_data['description'] = ""
+    
+    # Handle specifications field - convert dict to empty string if needed
+    if 'specifications' in cleaned_data:
+        if isinstance(cleaned_data['specifications'], dict):
+            cleaned_data['specifications'] = ""
+    
+    # Handle care_instructions field - convert dict to empty string if needed
+    if 'care_instructions' in cleaned_data:
+        if isinstance(cleaned_data['care_instructions'], dict):
+            cleaned_data['care_instructions'] = ""
+        # Map to 'care' field if needed
+        if 'care' not in cleaned_data:
+            cleaned_data['care'] = cleaned_data.get('care_instructions', "")
+    
+    return cleaned_data
@@ -7,10 +7,13 @@ Restaura los productos que fueron eliminados incorrectamente
 import asyncio
 import os
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError
 from datetime import datetime
 from dotenv import load_dotenv
 import uuid
 
+from migrations import migrate_document
+
 # Cargar variables de entorno
 load_dotenv()
 
@@ -102,23 +105,38 @@ class ProductRestorer:
             }
         ]
         
+        # Verificar en una sola consulta cuáles ya existen (clave normalizada del nombre)
+        # Llevar los productos al esquema actual antes de insertarlos
+        products_to_restore = [migrate_document(product) for product in products_to_restore]
+        existing = await self.db.products.find(
+            {"name_key": {"$in": [product["name_key"] for product in products_to_restore]}},
+            {"_id": 0, "name_key": 1}
+        ).to_list(None)
+        existing_keys = {product["name_key"] for product in existing}
+        
+        missing_products = []
         for product in products_to_restore:
+            if product["name_key"] in existing_keys:
+                print(f"ℹ️ Ya existe: {product['name']} ({product['category']})")
+            else:
+                missing_products.append(product)
+        
+        # Insertar todos los faltantes en un solo viaje a la base de datos
+        if missing_products:
             try:
-                # Verificar si ya existe un producto con este nombre exacto y categoría
-                existing = await self.db.products.find_one({
-                    "name": product["name"],
-                    "category": product["category"]
-                })
-                
-                if not existing:
-                    await self.db.products.insert_one(product)
+                result = await self.db.products.insert_many(missing_products, ordered=False)
+                inserted_ids = set(result.inserted_ids)
+            except BulkWriteError as e:
+                failed_indexes = {error["index"] for error in e.details.get("writeErrors", [])}
+                for index in sorted(failed_indexes):
+                    print(f"❌ Error restaurando {missing_products[index]['name']}")
+                inserted_ids = {product["_id"] for index, product in enumerate(missing_products)
+                                if index not in failed_indexes}
+            
+            for product in missing_products:
+                if product["_id"] in inserted_ids:
                     self.restored_count += 1
                     print(f"✅ Restaurado: {product['name']} ({product['category']}) - ${product['retail_price']:,}")
-                else:
-                    print(f"ℹ️ Ya existe: {product['name']} ({product['category']})")
-                    
-            except Exception as e:
-                print(f"❌ Error restaurando {product['name']}: {str(e)}")
         
         print("\n" + "=" * 60)
         print("🎉 RESTAURACIÓN COMPLETADA")
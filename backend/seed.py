@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+HANNU CLOTHES - Carga de datos iniciales
+Crea el administrador por defecto y los productos de ejemplo si la base de datos está vacía
+
+Uso: python seed.py [--skip-products]
+"""
+
+import argparse
+import asyncio
+import os
+import uuid
+from datetime import datetime
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from migrations import product_to_document
+from models import Admin, Product, hash_password
+
+# Cargar variables de entorno
+load_dotenv()
+
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = os.environ.get('DB_NAME', 'test_database')
+
+def sample_products():
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "name": "Vestido Rosa Elegante",
+            "description": "Vestido elegante perfecto para ocasiones especiales. Confeccionado en tela de alta calidad con acabados refinados.",
+            "retail_price": 150000,
+            "wholesale_price": 105000,
+            "category": "vestidos",
+            "image": "https://images.unsplash.com/photo-1633077705107-8f53a004218f?crop=entropy&cs=srgb&fm=jpg&ixid=M3w3NTY2Nzd8MHwxfHNlYXJjaHwyfHx3b21lbiUyMGRyZXNzZXN8ZW58MHx8fHwxNzU2OTk5NjU1fDA&ixlib=rb-4.1.0&q=85",
+            "specifications": "Vestido de corte A, manga corta, cuello redondo, cierre posterior invisible",
+            "composition": "95% Algodón, 5% Elastano",
+            "care": "Lavar a máquina en agua fría, no usar blanqueador, planchar a temperatura media",
+            "shipping_policy": "Envío nacional 2-5 días hábiles. Envío gratis en compras superiores a $200.000",
+            "exchange_policy": "Cambios y devoluciones hasta 15 días después de la compra. El producto debe estar en perfectas condiciones.",
+            "sizes": ["XS", "S", "M", "L", "XL"],
+            "stock": {"XS": 5, "S": 8, "M": 12, "L": 10, "XL": 6},
+            "created_at": datetime.utcnow(),
+            "updated_at": datetime.utcnow()
+        }
+    ]
+
+class DatabaseSeeder:
+    def __init__(self, db):
+        self.db = db
+
+    async def seed_admin(self):
+        """Crea el administrador por defecto si no existe ninguno"""
+        if await self.db.admins.find_one({}, {"_id": 1}):
+            print("ℹ️ Ya existen administradores, no se crea el administrador por defecto")
+            return
+
+        default_admin = Admin(
+            username="admin",
+            email="admin@hannuclothes.com",
+            password_hash=hash_password("admin123")
+        )
+        await self.db.admins.insert_one(default_admin.model_dump())
+        print("✅ Administrador por defecto creado: usuario=admin, contraseña=admin123")
+        print("⚠️ Cambia la contraseña desde el panel de administración")
+
+    async def seed_products(self):
+        """Crea los productos de ejemplo si el catálogo está vacío"""
+        if await self.db.products.find_one({}, {"_id": 1}):
+            print("ℹ️ El catálogo ya tiene productos, no se crean productos de ejemplo")
+            return
+
+        products = [product_to_document(Product(**product)) for product in sample_products()]
+        await self.db.products.insert_many(products)
+        print(f"✅ Productos de ejemplo creados: {len(products)}")
+
+    async def run(self, skip_products: bool = False):
+        print("🌱 CARGANDO DATOS INICIALES")
+        print("=" * 60)
+        await self.seed_admin()
+        if not skip_products:
+            await self.seed_products()
+        print("=" * 60)
+
+async def main(args):
+    client = AsyncIOMotorClient(MONGO_URL)
+    seeder = DatabaseSeeder(client[DB_NAME])
+    await seeder.run(skip_products=args.skip_products)
+    client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crea el administrador y los productos de ejemplo")
+    parser.add_argument("--skip-products", action="store_true", help="Solo crea el administrador por defecto")
+
+    print("HANNU CLOTHES - Datos Iniciales")
+    print()
+
+    asyncio.run(main(parser.parse_args()))
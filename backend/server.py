@@ -1,221 +1,1372 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, File, UploadFile, Form
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, File, UploadFile, Form, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import Response
+from fastapi.responses import ORJSONResponse, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.datastructures import MutableHeaders
+from prometheus_client import CollectorRegistry, Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from opentelemetry import propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import SpanKind, Status, StatusCode
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, InsertOne, UpdateOne, DeleteOne, ReturnDocument
+from pymongo import monitoring
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError, OperationFailure, PyMongoError
 import os
 import logging
+import logging.handlers
+import queue
+import random
+import contextvars
+import atexit
+import copy
+import gzip
+import orjson
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional, Dict, Union
+from pydantic import ValidationError, TypeAdapter
+from typing import List, Optional, Dict, Literal, Any
 import uuid
 from datetime import datetime, timedelta
 import hashlib
 import jwt
-from passlib.context import CryptContext
 import base64
-import re
 import httpx
 import asyncio
+import csv
+import io
+import itertools
+from collections import OrderedDict
+import time
+import secrets
+import math
+import threading
+import sys
+import traceback
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from normalization import normalize_name_key
+from migrations import PRODUCT_SCHEMA_VERSION, product_to_document
+from models import (
+    Product, PRODUCT_FIELDS, PRODUCT_FIELD_SET, ProductCreate, ProductUpdate, Admin, AdminPrincipal, AdminCreate,
+    AdminLogin, PasswordChange, Token, RefreshRequest, CatalogStats, StockUpdate, StockReservation,
+    StockReservationLine, StockBatchReservation, BulkProductRequest, BulkItemResult,
+    BulkProductResult, ImportRowError, CatalogImportResult, hash_password, verify_password
+)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+class Settings:
+    """Settings of one app instance, read from the environment by default"""
+    
+    def __init__(
+        self,
+        mongo_url: str,
+        db_name: str,
+        cors_origins: Optional[List[str]] = None,
+        max_pool_size: int = 100,
+        min_pool_size: int = 0,
+        wait_queue_timeout_ms: int = 5000,  # fail fast instead of queueing forever
+        server_selection_timeout_ms: int = 5000,
+        compressors: str = "zstd,snappy,zlib",  # zstd/snappy need the zstandard/python-snappy packages
+        public_read_preference: str = "secondaryPreferred",
+        max_staleness_seconds: int = -1,  # -1 = no limit, otherwise >= 90
+        jwt_secret_key: str = "hannu-clothes-catalog-secret-key-2024-production",
+        jwt_signing_keys: Optional[Dict[str, str]] = None,  # kid -> secret, besides "default"
+        jwt_active_key_id: str = "default",
+        imgbb_api_key: Optional[str] = None,
+        access_token_minutes: int = 15,
+        refresh_token_days: int = 14,
+        login_rate_limit_backend: str = "memory",  # memory or mongo (shared by all workers)
+        login_ip_burst: int = 10,
+        login_ip_per_minute: float = 10,
+        login_user_burst: int = 5,
+        login_user_per_minute: float = 5,
+        register_burst: int = 5,  # shared by all clients
+        register_per_minute: float = 2,
+        trust_forwarded_for: bool = False,  # only behind a proxy that appends it
+        trusted_proxy_count: int = 1,  # proxies in front of the app that append X-Forwarded-For
+        admin_cache_ttl_seconds: float = 60,
+        catalog_cache_ttl_seconds: float = 30,
+        catalog_cache_max_entries: int = 512,  # least recently used go first
+        catalog_cache_max_bytes: int = 64 * 1024 * 1024,
+        catalog_cache_max_entry_bytes: int = 8 * 1024 * 1024,  # larger responses are not cached
+        catalog_primary_read_seconds: float = 10,  # after an invalidation
+        cache_invalidation_bus: str = "changestream",  # changestream (replica sets) or local
+        password_hash_workers: int = 2,
+        password_hash_max_queue: int = 32,
+        log_level: str = "INFO",
+        log_format: str = "json",  # json or text
+        log_sample_rate: float = 0.1,  # share of high-volume events kept
+        request_profiling: bool = False,  # lets admins profile with X-Profile and /admin/debug/profile
+        profile_sample_interval_ms: float = 1,
+        profile_max_seconds: float = 60,
+        loop_lag_interval_seconds: float = 0.5,
+        loop_block_debug: bool = False,  # log the stack of callbacks holding the loop
+        loop_block_threshold_ms: float = 100,
+        tracing_exporter: str = "none",  # none, console or otlp (OTEL_EXPORTER_OTLP_ENDPOINT)
+        tracing_sample_ratio: float = 1.0,  # share of new traces recorded
+        query_profiler: bool = False,  # explains sampled queries
+        query_profiler_explain_interval_seconds: float = 300,
+        query_profiler_max_shapes: int = 500,
+        response_compression: str = "br,zstd,gzip",  # preferred first; empty disables it
+        compression_min_bytes: int = 1024
+    ):
+        self.mongo_url = mongo_url
+        self.db_name = db_name
+        self.cors_origins = cors_origins or ["*"]
+        self.max_pool_size = max_pool_size
+        self.min_pool_size = min_pool_size
+        self.wait_queue_timeout_ms = wait_queue_timeout_ms
+        self.server_selection_timeout_ms = server_selection_timeout_ms
+        self.compressors = compressors
+        self.public_read_preference = public_read_preference
+        self.max_staleness_seconds = max_staleness_seconds
+        self.jwt_secret_key = jwt_secret_key
+        self.jwt_signing_keys = jwt_signing_keys or {}
+        self.jwt_active_key_id = jwt_active_key_id
+        self.imgbb_api_key = imgbb_api_key
+        self.access_token_minutes = access_token_minutes
+        self.refresh_token_days = refresh_token_days
+        self.login_rate_limit_backend = login_rate_limit_backend
+        self.login_ip_burst = login_ip_burst
+        self.login_ip_per_minute = login_ip_per_minute
+        self.login_user_burst = login_user_burst
+        self.login_user_per_minute = login_user_per_minute
+        self.register_burst = register_burst
+        self.register_per_minute = register_per_minute
+        self.trust_forwarded_for = trust_forwarded_for
+        self.trusted_proxy_count = trusted_proxy_count
+        self.admin_cache_ttl_seconds = admin_cache_ttl_seconds
+        self.catalog_cache_ttl_seconds = catalog_cache_ttl_seconds
+        self.catalog_cache_max_entries = catalog_cache_max_entries
+        self.catalog_cache_max_bytes = catalog_cache_max_bytes
+        self.catalog_cache_max_entry_bytes = catalog_cache_max_entry_bytes
+        self.catalog_primary_read_seconds = catalog_primary_read_seconds
+        self.cache_invalidation_bus = cache_invalidation_bus
+        self.password_hash_workers = password_hash_workers
+        self.password_hash_max_queue = password_hash_max_queue
+        self.log_level = log_level.upper()
+        self.log_format = log_format
+        self.log_sample_rate = log_sample_rate
+        self.request_profiling = request_profiling
+        self.profile_sample_interval_ms = profile_sample_interval_ms
+        self.profile_max_seconds = profile_max_seconds
+        self.loop_lag_interval_seconds = loop_lag_interval_seconds
+        self.loop_block_debug = loop_block_debug
+        self.loop_block_threshold_ms = loop_block_threshold_ms
+        self.tracing_exporter = tracing_exporter
+        self.tracing_sample_ratio = tracing_sample_ratio
+        self.query_profiler = query_profiler
+        self.query_profiler_explain_interval_seconds = query_profiler_explain_interval_seconds
+        self.query_profiler_max_shapes = query_profiler_max_shapes
+        self.response_compression = response_compression
+        self.compression_min_bytes = compression_min_bytes
+    
+    @classmethod
+    def from_env(cls) -> "Settings":
+        env = os.environ.get
+        
+        def flag(name: str) -> bool:
+            return env(name, 'false').lower() == 'true'
+        
+        signing_keys = {}
+        for entry in env('JWT_SIGNING_KEYS', '').split(','):  # comma-separated kid:secret pairs
+            kid, separator, secret = entry.strip().partition(':')
+            if separator and kid and secret:
+                signing_keys[kid] = secret
+        return cls(
+            mongo_url=os.environ['MONGO_URL'],
+            db_name=os.environ['DB_NAME'],
+            cors_origins=env('CORS_ORIGINS', '*').split(','),
+            max_pool_size=int(env('MONGO_MAX_POOL_SIZE', '100')),
+            min_pool_size=int(env('MONGO_MIN_POOL_SIZE', '0')),
+            wait_queue_timeout_ms=int(env('MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000')),
+            server_selection_timeout_ms=int(env('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+            compressors=env('MONGO_COMPRESSORS', 'zstd,snappy,zlib'),
+            public_read_preference=env('MONGO_PUBLIC_READ_PREFERENCE', 'secondaryPreferred'),
+            max_staleness_seconds=int(env('MONGO_MAX_STALENESS_SECONDS', '-1')),
+            jwt_secret_key=env('JWT_SECRET_KEY', 'hannu-clothes-catalog-secret-key-2024-production'),
+            jwt_signing_keys=signing_keys,
+            jwt_active_key_id=env('JWT_ACTIVE_KEY_ID', 'default'),
+            imgbb_api_key=env('IMGBB_API_KEY'),
+            access_token_minutes=int(env('ACCESS_TOKEN_MINUTES', '15')),
+            refresh_token_days=int(env('REFRESH_TOKEN_DAYS', '14')),
+            login_rate_limit_backend=env('LOGIN_RATE_LIMIT_BACKEND', 'memory'),
+            login_ip_burst=int(env('LOGIN_IP_BURST', '10')),
+            login_ip_per_minute=float(env('LOGIN_IP_PER_MINUTE', '10')),
+            login_user_burst=int(env('LOGIN_USER_BURST', '5')),
+            login_user_per_minute=float(env('LOGIN_USER_PER_MINUTE', '5')),
+            register_burst=int(env('REGISTER_BURST', '5')),
+            register_per_minute=float(env('REGISTER_PER_MINUTE', '2')),
+            trust_forwarded_for=flag('TRUST_FORWARDED_FOR'),
+            trusted_proxy_count=int(env('TRUSTED_PROXY_COUNT', '1')),
+            admin_cache_ttl_seconds=float(env('ADMIN_CACHE_TTL_SECONDS', '60')),
+            catalog_cache_ttl_seconds=float(env('CATALOG_CACHE_TTL_SECONDS', '30')),
+            catalog_cache_max_entries=int(env('CATALOG_CACHE_MAX_ENTRIES', '512')),
+            catalog_cache_max_bytes=int(env('CATALOG_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+            catalog_cache_max_entry_bytes=int(env('CATALOG_CACHE_MAX_ENTRY_BYTES', str(8 * 1024 * 1024))),
+            catalog_primary_read_seconds=float(env('CATALOG_PRIMARY_READ_SECONDS', '10')),
+            cache_invalidation_bus=env('CACHE_INVALIDATION_BUS', 'changestream'),
+            password_hash_workers=int(env('PASSWORD_HASH_WORKERS', '2')),
+            password_hash_max_queue=int(env('PASSWORD_HASH_MAX_QUEUE', '32')),
+            log_level=env('LOG_LEVEL', 'INFO'),
+            log_format=env('LOG_FORMAT', 'json'),
+            log_sample_rate=float(env('LOG_SAMPLE_RATE', '0.1')),
+            request_profiling=flag('REQUEST_PROFILING'),
+            profile_sample_interval_ms=float(env('PROFILE_SAMPLE_INTERVAL_MS', '1')),
+            profile_max_seconds=float(env('PROFILE_MAX_SECONDS', '60')),
+            loop_lag_interval_seconds=float(env('LOOP_LAG_INTERVAL_SECONDS', '0.5')),
+            loop_block_debug=flag('LOOP_BLOCK_DEBUG'),
+            loop_block_threshold_ms=float(env('LOOP_BLOCK_THRESHOLD_MS', '100')),
+            tracing_exporter=env('TRACING_EXPORTER', 'none'),
+            tracing_sample_ratio=float(env('TRACING_SAMPLE_RATIO', '1.0')),
+            query_profiler=flag('QUERY_PROFILER'),
+            query_profiler_explain_interval_seconds=float(env('QUERY_PROFILER_EXPLAIN_INTERVAL_SECONDS', '300')),
+            query_profiler_max_shapes=int(env('QUERY_PROFILER_MAX_SHAPES', '500')),
+            response_compression=env('RESPONSE_COMPRESSION', 'br,zstd,gzip'),
+            compression_min_bytes=int(env('COMPRESSION_MIN_BYTES', '1024'))
+        )
+
+def available_compressors(names: str) -> List[str]:
+    """Configured wire compressors whose Python module is installed (zlib is always available)"""
+    modules = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+    compressors = []
+    for name in [name.strip() for name in names.split(",") if name.strip()]:
+        try:
+            __import__(modules[name])
+        except (KeyError, ImportError):
+            logging.getLogger(__name__).info("MongoDB compressor %s is not available, skipping it", name)
+            continue
+        compressors.append(name)
+    return compressors
+
+class MongoPoolMonitor(monitoring.ConnectionPoolListener):
+    """Connection pool utilization per server, fed by the driver's CMAP events"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checkout_started = threading.local()  # checkouts are synchronous on the calling thread
+        self.servers = {}
+    
+    def _server(self, address) -> dict:
+        key = "%s:%s" % address
+        if key not in self.servers:
+            self.servers[key] = {
+                "open": 0, "checked_out": 0, "peak_checked_out": 0, "waiting": 0, "peak_waiting": 0,
+                "checkouts": 0, "checkout_failures": 0, "pool_clears": 0, "total_wait_seconds": 0.0, "max_wait_seconds": 0.0
+            }
+        return self.servers[key]
+    
+    def pool_created(self, event):
+        with self._lock:
+            self._server(event.address)
+    
+    def pool_ready(self, event):
+        pass
+    
+    def pool_cleared(self, event):
+        with self._lock:
+            self._server(event.address)["pool_clears"] += 1
+    
+    def pool_closed(self, event):
+        with self._lock:
+            self.servers.pop("%s:%s" % event.address, None)
+    
+    def connection_created(self, event):
+        with self._lock:
+            self._server(event.address)["open"] += 1
+    
+    def connection_ready(self, event):
+        pass
+    
+    def connection_closed(self, event):
+        with self._lock:
+            server = self._server(event.address)
+            server["open"] = max(0, server["open"] - 1)
+    
+    def connection_check_out_started(self, event):
+        self._checkout_started.value = time.perf_counter()
+        with self._lock:
+            server = self._server(event.address)
+            server["waiting"] += 1
+            server["peak_waiting"] = max(server["peak_waiting"], server["waiting"])
+    
+    def _check_out_finished(self, server: dict):
+        server["waiting"] = max(0, server["waiting"] - 1)
+        started = getattr(self._checkout_started, "value", None)
+        if started is not None:
+            waited = time.perf_counter() - started
+            server["total_wait_seconds"] += waited
+            server["max_wait_seconds"] = max(server["max_wait_seconds"], waited)
+            self._checkout_started.value = None
+    
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            server = self._server(event.address)
+            self._check_out_finished(server)
+            server["checkout_failures"] += 1
+    
+    def connection_checked_out(self, event):
+        with self._lock:
+            server = self._server(event.address)
+            self._check_out_finished(server)
+            server["checkouts"] += 1
+            server["checked_out"] += 1
+            server["peak_checked_out"] = max(server["peak_checked_out"], server["checked_out"])
+    
+    def connection_checked_in(self, event):
+        with self._lock:
+            server = self._server(event.address)
+            server["checked_out"] = max(0, server["checked_out"] - 1)
+    
+    def stats(self) -> dict:
+        with self._lock:
+            servers = {}
+            for address, server in self.servers.items():
+                servers[address] = {
+                    **{key: value for key, value in server.items() if not key.endswith("_seconds")},
+                    "utilization": round(server["checked_out"] / settings.max_pool_size, 3) if settings.max_pool_size else 0.0,
+                    "avg_wait_ms": round(server["total_wait_seconds"] / server["checkouts"] * 1000, 2) if server["checkouts"] else 0.0,
+                    "max_wait_ms": round(server["max_wait_seconds"] * 1000, 2)
+                }
+        return {
+            "max_pool_size": settings.max_pool_size,
+            "min_pool_size": settings.min_pool_size,
+            "wait_queue_timeout_ms": settings.wait_queue_timeout_ms,
+            "compressors": mongo_compressors,
+            "public_read_preference": settings.public_read_preference,
+            "servers": servers
+        }
+
+mongo_pool_monitor = MongoPoolMonitor()
+
+# Metrics, exposed in the Prometheus text format on /metrics
+metrics_registry = CollectorRegistry()
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+http_requests_total = Counter(
+    "http_requests_total", "HTTP requests by route template, method and status",
+    ["method", "route", "status"], registry=metrics_registry
+)
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds", "Time from request start to the last response byte",
+    ["method", "route"], buckets=LATENCY_BUCKETS, registry=metrics_registry
+)
+http_response_size_bytes = Histogram(
+    "http_response_size_bytes", "Response body size",
+    ["method", "route"], buckets=SIZE_BUCKETS, registry=metrics_registry
+)
+mongo_command_duration_seconds = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command round-trip time as reported by the driver",
+    ["command", "collection", "outcome"], buckets=LATENCY_BUCKETS, registry=metrics_registry
+)
+upstream_request_duration_seconds = Histogram(
+    "upstream_request_duration_seconds", "Outgoing HTTP calls (image proxy sources, ImgBB uploads)",
+    ["upstream", "outcome"], buckets=LATENCY_BUCKETS, registry=metrics_registry
+)
+event_loop_lag_seconds = Histogram(
+    "event_loop_lag_seconds", "How late the loop lag probe woke up; time the loop was busy with other callbacks",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0), registry=metrics_registry
+)
+event_loop_blocks_total = Counter(
+    "event_loop_blocks_total", "Times the event loop was held past LOOP_BLOCK_THRESHOLD_MS (LOOP_BLOCK_DEBUG only)",
+    registry=metrics_registry
+)
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Feeds mongo_command_duration_seconds from the driver's command monitoring events"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._collections = {}
+    
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        with self._lock:
+            self._collections[event.request_id] = collection if isinstance(collection, str) else ""
+    
+    def _finished(self, event, outcome: str):
+        with self._lock:
+            collection = self._collections.pop(event.request_id, "")
+        mongo_command_duration_seconds.labels(event.command_name, collection, outcome).observe(event.duration_micros / 1e6)
+    
+    def succeeded(self, event):
+        self._finished(event, "success")
+    
+    def failed(self, event):
+        self._finished(event, "failure")
+
+mongo_command_metrics = MongoCommandMetrics()
+
+# Query profiler
+def query_shape(value):
+    """Filter/sort with every literal replaced by "?", keeping field names and operators"""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if value and all(isinstance(item, dict) for item in value):
+            return [query_shape(item) for item in value]
+        return ["?"]
+    return "?"
+
+def plan_summary(explain: dict) -> dict:
+    """Winning plan stages, index names and execution counters from an explain result"""
+    stages, indexes = [], []
+    
+    def walk(stage):
+        if not isinstance(stage, dict):
+            return
+        if "stage" in stage:
+            stages.append(stage["stage"])
+        if stage.get("indexName"):
+            indexes.append(stage["indexName"])
+        for key in ("queryPlan", "inputStage", "outerStage", "innerStage"):
+            walk(stage.get(key))
+        for child in stage.get("inputStages", []):
+            walk(child)
+    
+    planner = explain.get("queryPlanner") or (explain.get("stages") or [{}])[0].get("$cursor", {}).get("queryPlanner", {})
+    walk(planner.get("winningPlan"))
+    execution = explain.get("executionStats", {})
+    return {
+        "stages": stages,
+        "indexes": indexes,
+        "collection_scan": "COLLSCAN" in stages,
+        "docs_examined": execution.get("totalDocsExamined"),
+        "keys_examined": execution.get("totalKeysExamined"),
+        "docs_returned": execution.get("nReturned"),
+        "explain_ms": execution.get("executionTimeMillis")
+    }
+
+class QueryProfiler(monitoring.CommandListener):
+    """Opt-in profile of every query shape per endpoint, with a periodic explain of its plan"""
+    
+    # command name -> field holding the filter
+    profiled_commands = {"find": "filter", "findAndModify": "query", "update": "updates", "delete": "deletes",
+                         "aggregate": "pipeline", "count": "query", "distinct": "query"}
+    # driver-added fields that must not be sent back inside explain
+    session_fields = {"lsid", "txnNumber", "autocommit", "startTransaction"}
+    max_open_cursors = 10000
+    
+    def __init__(self, explain_interval_seconds: float, max_shapes: int):
+        self.explain_interval_seconds = explain_interval_seconds
+        self.max_shapes = max_shapes
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._cursors = {}  # open cursor id -> shape key, so getMore batches count for their query
+        self.shapes = {}
+        self.dropped = 0
+        self.loop = None
+    
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+    
+    def _shape_key(self, event) -> Optional[tuple]:
+        field = self.profiled_commands.get(event.command_name)
+        if field is None:
+            return None
+        command = event.command
+        if field in ("updates", "deletes"):
+            statements = command.get(field) or [{}]
+            shape = {"q": query_shape(statements[0].get("q", {}))}
+        elif field == "pipeline":
+            shape = [{name: query_shape(stage[name]) if name == "$match" else "?" for name in stage}
+                     for stage in command.get("pipeline", [])]
+        else:
+            shape = {"filter": query_shape(command.get(field, {}))}
+            if command.get("sort"):
+                shape["sort"] = dict(command["sort"])
+        scope = request_scope_var.get()
+        route = scope.get("route") if scope else None
+        endpoint = f"{scope['method']} {route.path}" if route is not None else "background"
+        return (endpoint, event.command_name, str(command.get(event.command_name)), orjson.dumps(shape, default=str).decode())
+    
+    def started(self, event):
+        if event.command_name in ("getMore", "killCursors"):
+            with self._lock:
+                if event.command_name == "getMore":
+                    if event.command["getMore"] in self._cursors:
+                        self._pending[event.request_id] = event.command["getMore"]
+                else:
+                    for cursor_id in event.command.get("cursors", []):
+                        self._cursors.pop(cursor_id, None)
+            return
+        key = self._shape_key(event)
+        if key is None:
+            return
+        with self._lock:
+            self._pending[event.request_id] = key
+            entry = self.shapes.get(key)
+            if entry is None:
+                if len(self.shapes) >= self.max_shapes:
+                    self.dropped += 1
+                    return
+                entry = self.shapes[key] = {"count": 0, "failures": 0, "total_seconds": 0.0, "max_seconds": 0.0,
+                                            "docs_returned": 0, "plan": None, "explained_at": None}
+            explain_due = entry["explained_at"] is None or time.time() - entry["explained_at"] >= self.explain_interval_seconds
+            if explain_due:
+                entry["explained_at"] = time.time()
+        if explain_due and self.loop is not None:
+            explain = {key: value for key, value in event.command.items()
+                       if not key.startswith("$") and key not in self.session_fields}
+            if event.command_name in ("update", "delete"):
+                explain[self.profiled_commands[event.command_name]] = explain[self.profiled_commands[event.command_name]][:1]
+            asyncio.run_coroutine_threadsafe(self._explain(key, event.database_name, explain), self.loop)
+    
+    def _finished(self, event, failed: bool):
+        with self._lock:
+            key = self._pending.pop(event.request_id, None)
+            if event.command_name == "getMore" and key is not None:
+                cursor_id = key
+                cursor = {} if failed else event.reply.get("cursor", {})
+                key = self._cursors.get(cursor_id) if cursor.get("id") else self._cursors.pop(cursor_id, None)
+            entry = self.shapes.get(key) if key else None
+            if entry is None:
+                return
+            seconds = event.duration_micros / 1e6
+            entry["total_seconds"] += seconds
+            if event.command_name == "getMore":
+                entry["docs_returned"] += len(cursor.get("nextBatch", []))
+                return
+            entry["count"] += 1
+            entry["failures"] += int(failed)
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+            if not failed:
+                reply = event.reply
+                if "cursor" in reply:
+                    entry["docs_returned"] += len(reply["cursor"].get("firstBatch", []))
+                    if reply["cursor"].get("id") and len(self._cursors) < self.max_open_cursors:
+                        self._cursors[reply["cursor"]["id"]] = key
+                else:
+                    entry["docs_returned"] += reply.get("n", 0)
+    
+    def succeeded(self, event):
+        self._finished(event, failed=False)
+    
+    def failed(self, event):
+        self._finished(event, failed=True)
+    
+    async def _explain(self, key: tuple, database_name: str, command: dict):
+        try:
+            result = await client[database_name].command({"explain": command, "verbosity": "executionStats"})
+            plan = plan_summary(result)
+        except Exception as e:
+            plan = {"error": str(e)}
+        with self._lock:
+            if key in self.shapes:
+                self.shapes[key]["plan"] = plan
+    
+    def report(self, limit: int, sort: str) -> dict:
+        with self._lock:
+            rows = []
+            for (endpoint, command, collection, shape), entry in self.shapes.items():
+                if not entry["count"]:
+                    continue
+                rows.append({
+                    "endpoint": endpoint,
+                    "command": command,
+                    "collection": collection,
+                    "shape": orjson.loads(shape),
+                    "count": entry["count"],
+                    "failures": entry["failures"],
+                    "total_ms": round(entry["total_seconds"] * 1000, 2),
+                    "avg_ms": round(entry["total_seconds"] / entry["count"] * 1000, 2),
+                    "max_ms": round(entry["max_seconds"] * 1000, 2),
+                    "avg_docs_returned": round(entry["docs_returned"] / entry["count"], 2),
+                    "plan": entry["plan"]
+                })
+            dropped = self.dropped
+        rows.sort(key=lambda row: row[sort], reverse=True)
+        return {"enabled": True, "shapes": len(rows), "dropped_shapes": dropped, "queries": rows[:limit]}
+    
+    def reset(self):
+        with self._lock:
+            self.shapes.clear()
+            self.dropped = 0
+
+query_profiler = None  # set up by configure() when QUERY_PROFILER=true
+
+class RuntimeStatsCollector:
+    """Exports the pool and cache counters kept by this worker as gauges at scrape time"""
+    
+    def collect(self):
+        pool = GaugeMetricFamily("mongo_pool_connections", "MongoDB pool connections by state", labels=["server", "state"])
+        waits = GaugeMetricFamily("mongo_pool_checkout_wait_avg_seconds", "Average pool checkout wait", labels=["server"])
+        if settings is not None:
+            for address, server in mongo_pool_monitor.stats()["servers"].items():
+                for state in ("open", "checked_out", "waiting"):
+                    pool.add_metric([address, state], server[state])
+                waits.add_metric([address], server["avg_wait_ms"] / 1000)
+        yield pool
+        yield waits
+        
+        password_pool = password_hasher.stats()
+        yield GaugeMetricFamily("password_hash_pending", "Password hashing calls running or queued", value=password_pool["pending"])
+        
+        cache = catalog_cache.stats()
+        lookups = GaugeMetricFamily("catalog_cache_lookups", "Catalog cache lookups since start", labels=["result"])
+        lookups.add_metric(["hit"], cache["hits"])
+        lookups.add_metric(["miss"], cache["misses"])
+        yield lookups
+        yield GaugeMetricFamily("catalog_cache_entries", "Catalog cache entries", value=cache["entries"])
+
+metrics_registry.register(RuntimeStatsCollector())
+
+class MetricsMiddleware:
+    """ASGI middleware recording count, latency and response size per route template"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        started = time.perf_counter()
+        status = 500
+        size = 0
+        
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            route_path = route.path if route is not None else "unmatched"
+            method = scope["method"]
+            http_requests_total.labels(method, route_path, str(status)).inc()
+            http_request_duration_seconds.labels(method, route_path).observe(time.perf_counter() - started)
+            http_response_size_bytes.labels(method, route_path).observe(size)
+
+# Response compression
+# Media that is already compressed gains nothing from another pass
+INCOMPRESSIBLE_TYPES = ("image/", "video/", "audio/", "font/woff", "application/zip", "application/gzip", "application/octet-stream")
 
-# Create the main app without a prefix
-app = FastAPI(title="HANNU CLOTHES CATALOG API", description="Professional catalog system for women's clothing")
+def available_encoders(names: str) -> Dict[str, tuple]:
+    """Installed content codings: name -> (per-response compress, cached-variant compress)"""
+    encoders = {}
+    for name in [name.strip() for name in names.split(",") if name.strip()]:
+        try:
+            if name == "gzip":
+                encoders[name] = (lambda body: gzip.compress(body, compresslevel=6, mtime=0),
+                                  lambda body: gzip.compress(body, compresslevel=9, mtime=0))
+            elif name == "br":
+                import brotli
+                encoders[name] = (lambda body: brotli.compress(body, quality=4),
+                                  lambda body: brotli.compress(body, quality=5))
+            elif name == "zstd":
+                import zstandard
+                # Compressor objects are not thread-safe and compression may run in worker threads
+                encoders[name] = (lambda body: zstandard.ZstdCompressor(level=3).compress(body),
+                                  lambda body: zstandard.ZstdCompressor(level=6).compress(body))
+            else:
+                raise ImportError(name)
+        except ImportError:
+            logging.getLogger(__name__).info("Response compression %s is not available, skipping it", name)
+    return encoders
+
+response_encoders = {}  # set up by configure()
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Accepted coding with the highest q-value (ties go to our order); None means identity"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for name in response_encoders:
+        quality = accepted.get(name, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+async def compress_body(compress, body: bytes) -> bytes:
+    # Large bodies take milliseconds to compress; keep that off the event loop
+    if len(body) >= OFFLOAD_ENCODE_MIN_BYTES:
+        return await asyncio.to_thread(compress, body)
+    return compress(body)
+
+class CompressedBody:
+    """A cached response body with its compressed variants, built on first request"""
+    
+    def __init__(self, body: bytes):
+        self.body = body
+        self.variants = {}
+    
+    async def encoded(self, encoding: Optional[str]) -> tuple:
+        if encoding is None or len(self.body) < settings.compression_min_bytes:
+            return self.body, None
+        variant = self.variants.get(encoding)
+        if variant is None:
+            variant = await compress_body(response_encoders[encoding][1], self.body)
+            self.variants[encoding] = variant
+        return variant, encoding
+
+async def cached_response(request: Request, cached: CompressedBody, media_type: str = "application/json") -> Response:
+    body, encoding = await cached.encoded(negotiate_encoding(request.headers.get("accept-encoding", "")))
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses with the best coding the client accepts"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not response_encoders:
+            await self.app(scope, receive, send)
+            return
+        
+        encoding = None
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                encoding = negotiate_encoding(value.decode("latin-1"))
+                break
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        
+        start_message = None
+        passthrough = False
+        
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start_message = message  # held until the first body chunk shows the size
+                return
+            
+            headers = MutableHeaders(scope=start_message)
+            body = message.get("body", b"")
+            content_type = headers.get("content-type", "")
+            if ("content-encoding" in headers or content_type.startswith(INCOMPRESSIBLE_TYPES)
+                    or message.get("more_body", False) or len(body) < settings.compression_min_bytes):
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+            
+            compressed = await compress_body(response_encoders[encoding][0], body)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            passthrough = True
+            await send(start_message)
+            await send({"type": "http.response.body", "body": compressed})
+        
+        await self.app(scope, receive, send_wrapper)
+
+read_preferences = {"primary": Primary, "primaryPreferred": PrimaryPreferred, "secondary": Secondary,
+                    "secondaryPreferred": SecondaryPreferred, "nearest": Nearest}
+
+settings = None  # of the current app, set by configure()
+
+# MongoDB connection, opened by the app's lifespan rather than at import time
+mongo_compressors = []
+client = None
+db = None
+catalog_db = None
+
+def connect_database(app_settings: Settings):
+    global mongo_compressors, client, db, catalog_db
+    mongo_compressors = available_compressors(app_settings.compressors)
+    client = AsyncIOMotorClient(
+        app_settings.mongo_url,
+        maxPoolSize=app_settings.max_pool_size,
+        minPoolSize=app_settings.min_pool_size,
+        waitQueueTimeoutMS=app_settings.wait_queue_timeout_ms,
+        serverSelectionTimeoutMS=app_settings.server_selection_timeout_ms,
+        compressors=mongo_compressors or None,
+        event_listeners=[mongo_pool_monitor, mongo_command_metrics]
+                        + ([query_profiler] if query_profiler else [])
+                        + ([mongo_command_tracer] if app_settings.tracing_exporter != "none" else [])
+    )
+    db = client[app_settings.db_name]
+    # Public catalog reads tolerate slightly stale data, so they can be served by secondaries
+    if app_settings.public_read_preference == "primary":
+        catalog_db = db  # primary takes no staleness bound
+    else:
+        catalog_db = db.with_options(read_preference=read_preferences[app_settings.public_read_preference](
+            max_staleness=app_settings.max_staleness_seconds
+        ))
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
 # Security
 security = HTTPBearer()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'hannu-clothes-catalog-secret-key-2024-production')
-IMGBB_API_KEY = os.getenv("IMGBB_API_KEY")
-
-# Models
-class Product(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    name: str
-    description: str = ""
-    retail_price: Union[int, float]  # Accept both int and float
-    wholesale_price: Union[int, float]  # Accept both int and float
-    category: str  # vestidos, enterizos, conjuntos, blusas, faldas, pantalones
-    image: str = ""  # Keep for backward compatibility, make optional
-    images: List[str] = Field(default_factory=list)  # Support multiple images
-    colors: List[str] = Field(default_factory=list)  # Support multiple colors
-    specifications: str = ""
-    composition: str = ""
-    care: str = ""
-    shipping_policy: str = ""
-    exchange_policy: str = ""
-    sizes: List[str] = Field(default_factory=list)
-    stock: Dict[str, int] = Field(default_factory=dict)  # size -> quantity
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
+MAX_PRODUCT_LIST_LIMIT = 1000
+MAX_BULK_OPERATIONS = 1000
+IMPORT_BATCH_SIZE = 500
+IMPORT_TEXT_FIELDS = ["name", "description", "category", "image", "specifications", "composition",
+                      "care", "shipping_policy", "exchange_policy"]
+IMPORT_PRICE_FIELDS = ["retail_price", "wholesale_price"]
+IMPORT_LIST_FIELDS = ["images", "colors", "sizes"]  # comma-separated cells
+
+# Models (defined in models.py); the read fast path below works on stored documents
+product_payload_adapter = TypeAdapter(List[Dict[str, Any]])
+
+def is_normalized(doc: dict) -> bool:
+    """Documents at the current schema version were validated when written"""
+    return doc.get("schema_version", 0) >= PRODUCT_SCHEMA_VERSION and PRODUCT_FIELD_SET <= doc.keys()
+
+def product_from_document(doc: dict) -> Product:
+    """Build a Product from a stored document, skipping cleaning and validation when it is normalized"""
+    if is_normalized(doc):
+        return Product.model_construct(**{field: doc[field] for field in PRODUCT_FIELDS})
+    return Product.from_dict(doc)
+
+def product_payload(doc: dict) -> dict:
+    """Response fields of a stored product; only legacy shapes go through from_dict"""
+    if is_normalized(doc):
+        return {field: doc[field] for field in PRODUCT_FIELDS}
+    return Product.from_dict(doc).model_dump()
+
+def products_response(docs: List[dict]) -> Response:
+    """Serialize a product list straight to JSON, so FastAPI doesn't validate every product again"""
+    return Response(
+        content=product_payload_adapter.dump_json([product_payload(doc) for doc in docs]),
+        media_type="application/json"
+    )
+
+# Helper functions
+
+class PasswordHasher:
+    """Runs bcrypt on a dedicated, bounded thread pool so it doesn't block the event loop"""
     
-    @classmethod
-    def from_dict(cls, data: dict):
-        """Create Product from dict with data cleaning"""
-        # Clean up the data to handle inconsistencies
-        cleaned_data = data.copy()
-        
-        # Remove MongoDB _id field if present
-        if '_id' in cleaned_data:
-            del cleaned_data['_id']
-        
-        # Ensure image field exists
-        if 'image' not in cleaned_data:
-            cleaned_data['image'] = ""
-        
-        # Handle colors field - convert empty string to empty list
-        if 'colors' in cleaned_data:
-            if isinstance(cleaned_data['colors'], str):
-                if cleaned_data['colors'].strip():
-                    cleaned_data['colors'] = [c.strip() for c in cleaned_data['colors'].split(',') if c.strip()]
-                else:
-                    cleaned_data['colors'] = []
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = None  # created on first use, so the app can be restarted after shutdown()
+        self.pending = 0  # submitted and not finished yet (running + queued)
+        self.peak_pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+    
+    async def _run(self, func, *args):
+        if self.pending >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Too many password operations in progress, please retry")
         
-        # Handle sizes field - convert empty string to empty list
-        if 'sizes' in cleaned_data:
-            if isinstance(cleaned_data['sizes'], str):
-                if cleaned_data['sizes'].strip():
-                    cleaned_data['sizes'] = [s.strip() for s in cleaned_data['sizes'].split(',') if s.strip()]
-                else:
-                    cleaned_data['sizes'] = []
+        submitted_at = time.perf_counter()
         
-        # Handle images field - ensure it's a list
-        if 'images' in cleaned_data:
-            if isinstance(cleaned_data['images'], str):
-                if cleaned_data['images'].strip():
-                    cleaned_data['images'] = [cleaned_data['images']]
-                else:
-                    cleaned_data['images'] = []
-        
-        # Ensure description exists
-        if 'description' not in cleaned_data:
-            cleaned_data['description'] = ""
-        
-        # Handle specifications field - convert dict to empty string if needed
-        if 'specifications' in cleaned_data:
-            if isinstance(cleaned_data['specifications'], dict):
-                cleaned_data['specifications'] = ""
-        
-        # Handle care_instructions field - convert dict to empty string if needed
-        if 'care_instructions' in cleaned_data:
-            if isinstance(cleaned_data['care_instructions'], dict):
-                cleaned_data['care_instructions'] = ""
-            # Map to 'care' field if needed
-            if 'care' not in cleaned_data:
-                cleaned_data['care'] = cleaned_data.get('care_instructions', "")
-        
-        return cls(**cleaned_data)
-
-class ProductCreate(BaseModel):
-    name: str
-    description: str
-    retail_price: Union[int, float]
-    wholesale_price: Union[int, float]
-    category: str
-    image: Optional[str] = ""  # Keep for backward compatibility
-    images: List[str] = Field(default_factory=list)  # Support multiple images
-    colors: List[str] = Field(default_factory=list)  # Support multiple colors
-    specifications: Optional[str] = ""
-    composition: Optional[str] = ""
-    care: Optional[str] = ""
-    shipping_policy: Optional[str] = ""
-    exchange_policy: Optional[str] = ""
-    sizes: List[str] = Field(default_factory=list)
-    stock: Optional[Dict[str, int]] = Field(default_factory=dict)
-
-class ProductUpdate(BaseModel):
-    name: Optional[str] = None
-    description: Optional[str] = None
-    retail_price: Optional[Union[int, float]] = None
-    wholesale_price: Optional[Union[int, float]] = None
-    category: Optional[str] = None
-    image: Optional[str] = None  # Keep for backward compatibility
-    images: Optional[List[str]] = None  # Support multiple images
-    colors: Optional[List[str]] = None  # Support multiple colors
-    specifications: Optional[str] = None
-    composition: Optional[str] = None
-    care: Optional[str] = None
-    shipping_policy: Optional[str] = None
-    exchange_policy: Optional[str] = None
-    sizes: Optional[List[str]] = None
-    stock: Optional[Dict[str, int]] = None
-
-class Admin(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    username: str
-    email: EmailStr
-    password_hash: str
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    is_active: bool = True
-
-class AdminCreate(BaseModel):
-    username: str
-    email: EmailStr
-    password: str
-
-class AdminLogin(BaseModel):
-    username: str
-    password: str
-
-class Token(BaseModel):
-    access_token: str
-    token_type: str
-
-class CatalogStats(BaseModel):
-    total_products: int
-    products_by_category: Dict[str, int]
-    total_stock_value_retail: int
-    total_stock_value_wholesale: int
-    low_stock_products: List[str]
-
-class StockUpdate(BaseModel):
-    size: str
-    quantity: int
+        def timed_call():
+            started_at = time.perf_counter()
+            result = func(*args)
+            return result, started_at - submitted_at, time.perf_counter() - started_at
+        
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="password-hash")
+        
+        self.pending += 1
+        self.peak_pending = max(self.peak_pending, self.pending)
+        try:
+            result, waited, ran = await asyncio.get_running_loop().run_in_executor(self._executor, timed_call)
+        finally:
+            self.pending -= 1
+        
+        self.completed += 1
+        self.total_wait_seconds += waited
+        self.total_run_seconds += ran
+        return result
+    
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+    
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+    
+    def stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "pending": self.pending,
+            "queue_depth": max(0, self.pending - self.max_workers),
+            "peak_pending": self.peak_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.total_wait_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+            "avg_run_ms": round(self.total_run_seconds / self.completed * 1000, 2) if self.completed else 0.0
+        }
+    
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
 
-# Helper functions
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+password_hasher = None  # set up by configure()
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+class SigningKeyring:
+    """HS256 signing keys by key id; the active key signs, every listed key verifies"""
+    
+    def __init__(self, keys: Dict[str, str], active_kid: str):
+        if active_kid not in keys:
+            raise RuntimeError(f"JWT_ACTIVE_KEY_ID '{active_kid}' is not in JWT_SIGNING_KEYS")
+        self.keys = keys
+        self.active_kid = active_kid
+    
+    @classmethod
+    def from_settings(cls, app_settings: Settings) -> "SigningKeyring":
+        return cls({"default": app_settings.jwt_secret_key, **app_settings.jwt_signing_keys}, app_settings.jwt_active_key_id)
+    
+    def verification_key(self, token: str) -> str:
+        # Tokens issued before key ids existed have no kid header
+        kid = jwt.get_unverified_header(token).get("kid", "default")
+        if kid not in self.keys:
+            raise jwt.InvalidTokenError(f"Unknown signing key id: {kid}")
+        return self.keys[kid]
+
+signing_keys = None  # set up by configure()
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(hours=24)
+        expire = datetime.utcnow() + timedelta(minutes=settings.access_token_minutes)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm="HS256")
+    encoded_jwt = jwt.encode(
+        to_encode,
+        signing_keys.keys[signing_keys.active_kid],
+        algorithm="HS256",
+        headers={"kid": signing_keys.active_kid}
+    )
     return encoded_jwt
 
+def hash_refresh_token(refresh_token: str) -> str:
+    # Refresh tokens are 256-bit random values, so a fast hash is enough (no bcrypt needed)
+    return hashlib.sha256(refresh_token.encode()).hexdigest()
+
+async def issue_tokens(admin: dict, family_id: Optional[str] = None) -> dict:
+    """Issue a short-lived access token plus a single-use, rotating refresh token"""
+    refresh_token = secrets.token_urlsafe(32)
+    now = datetime.utcnow()
+    await db.refresh_tokens.insert_one({
+        "token_hash": hash_refresh_token(refresh_token),
+        "admin_id": admin["id"],
+        "family_id": family_id or str(uuid.uuid4()),
+        "token_version": admin.get("token_version", 0),
+        "used": False,
+        "created_at": now,
+        "expires_at": now + timedelta(days=settings.refresh_token_days)
+    })
+    return {
+        "access_token": create_access_token(data=admin_token_claims(admin)),
+        "token_type": "bearer",
+        "refresh_token": refresh_token,
+        "expires_in": settings.access_token_minutes * 60
+    }
+
+class TokenBucketLimiter:
+    """In-memory token bucket per key; a request spends one token or is rejected"""
+    
+    def __init__(self, name: str, capacity: int, refill_per_second: float, max_keys: int = 10000):
+        self.name = name
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.max_keys = max_keys
+        self._buckets = {}  # key -> (tokens, updated_at)
+    
+    async def consume(self, key: str) -> float:
+        """Spend a token for key; returns 0 when allowed, otherwise seconds until a token is available"""
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated_at) * self.refill_per_second)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._prune(now)
+        return 0.0 if allowed else (1 - tokens) / self.refill_per_second
+    
+    def _prune(self, now: float):
+        # Buckets idle long enough to be full again carry no state worth keeping
+        full_after = self.capacity / self.refill_per_second
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if now - bucket[1] < full_after}
+
+class MongoTokenBucketLimiter(TokenBucketLimiter):
+    """Token bucket kept in MongoDB so every worker shares the same budget"""
+    
+    def __init__(self, name: str, capacity: int, refill_per_second: float, collection_name: str):
+        super().__init__(name, capacity, refill_per_second)
+        self.collection_name = collection_name  # resolved per call: the database is connected after import
+    
+    async def consume(self, key: str) -> float:
+        now = time.time()
+        refilled = {"$min": [self.capacity, {"$add": [
+            {"$ifNull": ["$tokens", self.capacity]},
+            {"$multiply": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, self.refill_per_second]}
+        ]}]}
+        bucket = await db[self.collection_name].find_one_and_update(
+            {"_id": f"{self.name}:{key}"},
+            [
+                {"$set": {"tokens": refilled, "updated_at": now}},
+                {"$set": {
+                    "allowed": {"$gte": ["$tokens", 1]},
+                    "tokens": {"$cond": [{"$gte": ["$tokens", 1]}, {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                    "expires_at": {"$add": ["$$NOW", int(self.capacity / self.refill_per_second * 1000)]}
+                }}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return 0.0 if bucket["allowed"] else (1 - bucket["tokens"]) / self.refill_per_second
+
+def build_login_limiter(name: str, burst: int, per_minute: float) -> TokenBucketLimiter:
+    if settings.login_rate_limit_backend == "mongo":
+        return MongoTokenBucketLimiter(name, burst, per_minute / 60, "rate_limits")
+    return TokenBucketLimiter(name, burst, per_minute / 60)
+
+# Set up by configure()
+login_ip_limiter = None
+login_user_limiter = None
+register_limiter = None
+
+def client_ip(request: Request) -> str:
+    """Peer address, or with TRUST_FORWARDED_FOR the one the outermost trusted proxy saw"""
+    forwarded_for = request.headers.get("x-forwarded-for")
+    if settings.trust_forwarded_for and forwarded_for and settings.trusted_proxy_count > 0:
+        hops = [hop.strip() for hop in forwarded_for.split(",") if hop.strip()]
+        if hops:
+            return hops[-min(settings.trusted_proxy_count, len(hops))]
+    return request.client.host if request.client else "unknown"
+
+async def enforce_login_rate_limit(request: Request, username: Optional[str] = None, registration: bool = False):
+    """Reject credential attempts over budget before any password hashing happens"""
+    retry_after = await login_ip_limiter.consume(client_ip(request))
+    if not retry_after and username is not None:
+        retry_after = await login_user_limiter.consume(username.strip().lower())
+    if not retry_after and registration:
+        retry_after = await register_limiter.consume("all")
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many login attempts, please try again later",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
+def admin_token_claims(admin: dict) -> dict:
+    """Claims embedded in admin tokens so requests can be authorized without a database lookup"""
+    return {
+        "sub": admin["username"],
+        "aid": admin["id"],
+        "role": admin.get("role", "admin"),
+        "active": admin.get("is_active", True),
+        "ver": admin.get("token_version", 0)
+    }
+
+class AdminCache:
+    """In-process TTL cache of each admin's token version and active flag"""
+    
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._entries = {}
+    
+    def get(self, admin_id: str) -> Optional[dict]:
+        entry = self._entries.get(admin_id)
+        if entry is None:
+            return None
+        state, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[admin_id]
+            return None
+        return state
+    
+    def set(self, admin: dict):
+        state = {"token_version": admin.get("token_version", 0), "is_active": admin.get("is_active", True)}
+        self._entries[admin["id"]] = (state, time.monotonic() + self.ttl_seconds)
+    
+    def invalidate(self, admin_id: Optional[str] = None):
+        if admin_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(admin_id, None)
+
+admin_cache = None  # set up by configure()
+
+class CatalogCache:
+    """In-process TTL cache for the public catalog, bounded by entry count and total bytes"""
+    
+    def __init__(self, ttl_seconds: float, max_entries: int = 512, max_bytes: int = 64 * 1024 * 1024,
+                 max_entry_bytes: int = 8 * 1024 * 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries = OrderedDict()  # key -> (value, expires_at, nbytes)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.dropped = 0
+        self.oversized = 0
+        self.generation = 0  # bumped by every invalidation
+        self.last_invalidation = float("-inf")
+    
+    def get(self, key: tuple):
+        entry = self._entries.get(key)
+        if entry is None or entry[1] < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            trace.get_current_span().set_attribute(f"cache.{key[0]}", "miss")
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        trace.get_current_span().set_attribute(f"cache.{key[0]}", "hit")
+        return entry[0]
+    
+    def set(self, key: tuple, value, nbytes: int, generation: Optional[int] = None):
+        """Store value of about nbytes; results read before a newer invalidation are skipped"""
+        if self.ttl_seconds <= 0 or self.max_entries <= 0:
+            return
+        if generation is not None and generation != self.generation:
+            return
+        if nbytes > self.max_entry_bytes:
+            self.oversized += 1
+            return
+        self._remove(key)
+        self._entries[key] = (value, time.monotonic() + self.ttl_seconds, nbytes)
+        self.nbytes += nbytes
+        if len(self._entries) > self.max_entries or self.nbytes > self.max_bytes:
+            now = time.monotonic()
+            for expired in [entry_key for entry_key, entry in self._entries.items() if entry[1] < now]:
+                self._remove(expired)
+                self.dropped += 1
+        while len(self._entries) > self.max_entries or self.nbytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.dropped += 1
+    
+    def _remove(self, key: tuple):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[2]
+    
+    def evict_product(self, product_id: Optional[str] = None):
+        """Lists and stats depend on every product; single products only on their own id"""
+        self.generation += 1
+        self.last_invalidation = time.monotonic()
+        if product_id is None:
+            evicted = len(self._entries)
+            self._entries.clear()
+            self.nbytes = 0
+        else:
+            stale = [key for key in self._entries if key[0] != "product" or key[1] == product_id]
+            for key in stale:
+                self._remove(key)
+            evicted = len(stale)
+        self.evictions += evicted
+    
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "ttl_seconds": self.ttl_seconds,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "entries": len(self._entries),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "dropped": self.dropped,
+            "oversized": self.oversized
+        }
+
+catalog_cache = None  # set up by configure()
+
+def catalog_source():
+    """Database for catalog cache fills: the primary for a while after an invalidation"""
+    if time.monotonic() - catalog_cache.last_invalidation < settings.catalog_primary_read_seconds:
+        return db
+    return catalog_db
+
+class LocalInvalidationBus:
+    """In-process pub/sub for cache invalidations; a document id of None means anything changed"""
+    
+    def __init__(self):
+        self._subscribers = {}
+        self.published = 0
+        self.received = 0
+    
+    def subscribe(self, collection: str, handler):
+        self._subscribers.setdefault(collection, []).append(handler)
+    
+    def _deliver(self, collection: str, document_id: Optional[str]):
+        for handler in self._subscribers.get(collection, []):
+            handler(document_id)
+    
+    def publish(self, collection: str, document_id: Optional[str] = None):
+        """Called right after a write, so the writing worker always reads its own writes"""
+        self.published += 1
+        self._deliver(collection, document_id)
+    
+    async def start(self):
+        pass
+    
+    async def stop(self):
+        pass
+    
+    def stats(self) -> dict:
+        return {"mode": "local", "published": self.published, "received": self.received}
+
+class ChangeStreamInvalidationBus(LocalInvalidationBus):
+    """Invalidation bus that also delivers other workers' writes, from MongoDB change streams"""
+    
+    # The id field is all the caches need; _id carries the resume token and must stay
+    pipeline = [{"$project": {"operationType": 1, "fullDocument.id": 1}}]
+    
+    def __init__(self, collections: List[str], retry_seconds: float = 5.0):
+        super().__init__()
+        self.collections = collections
+        self.retry_seconds = retry_seconds
+        self.watching = set()
+        self.errors = 0
+        self._tasks = []
+    
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._watch(collection)) for collection in self.collections]
+    
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.watching.clear()
+    
+    async def _watch(self, collection: str):
+        resume_token = None
+        while True:
+            try:
+                async with db[collection].watch(self.pipeline, full_document="updateLookup", resume_after=resume_token) as stream:
+                    self.watching.add(collection)
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        self.received += 1
+                        # Deletes carry no document: None flushes the collection's caches
+                        self._deliver(collection, (change.get("fullDocument") or {}).get("id"))
+            except (NotImplementedError, OperationFailure) as e:
+                if isinstance(e, NotImplementedError) or e.code == 40573:  # not a replica set
+                    self.watching.discard(collection)
+                    logger.warning(f"Change streams unavailable, {collection} cache invalidation is local only: {str(e)}")
+                    return
+                self._stream_failed(collection, e)
+                if e.code == 286:  # resume point no longer in the oplog
+                    resume_token = None
+            except PyMongoError as e:
+                self._stream_failed(collection, e)
+            except Exception:
+                self.watching.discard(collection)
+                logger.exception(f"Change stream on {collection} stopped, cache invalidation is local only")
+                return
+            await asyncio.sleep(self.retry_seconds)
+    
+    def _stream_failed(self, collection: str, error: Exception):
+        self.errors += 1
+        self.watching.discard(collection)
+        self._deliver(collection, None)
+        logger.warning(f"Change stream on {collection} failed, retrying: {str(error)}")
+    
+    def stats(self) -> dict:
+        return {
+            "mode": "changestream",
+            "watching": sorted(self.watching),
+            "published": self.published,
+            "received": self.received,
+            "errors": self.errors
+        }
+
+def build_cache_bus() -> LocalInvalidationBus:
+    if settings.cache_invalidation_bus == "changestream":
+        bus = ChangeStreamInvalidationBus(["products", "admins"])
+    else:
+        bus = LocalInvalidationBus()
+    bus.subscribe("products", catalog_cache.evict_product)
+    bus.subscribe("admins", admin_cache.invalidate)
+    return bus
+
+cache_bus = None  # set up by configure()
+
+async def revoke_admin_tokens(admin_id: str, changes: Optional[dict] = None):
+    """Bump the admin's token version (invalidating every issued token) and apply optional changes"""
+    update = {"$inc": {"token_version": 1}}
+    if changes:
+        update["$set"] = changes
+    result = await db.admins.update_one({"id": admin_id}, update)
+    cache_bus.publish("admins", admin_id)
+    return result
+
 async def get_current_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=["HS256"])
+        payload = jwt.decode(
+            credentials.credentials,
+            signing_keys.verification_key(credentials.credentials),
+            algorithms=["HS256"]
+        )
         username: str = payload.get("sub")
         if username is None:
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
     
-    admin = await db.admins.find_one({"username": username})
-    if admin is None:
-        raise HTTPException(status_code=401, detail="Admin not found")
+    admin_id = payload.get("aid")
+    if admin_id is None:
+        # Token issued before claims were embedded: look the admin up; it carries version 0
+        admin = await db.admins.find_one({"username": username}, {"_id": 0, "password_hash": 0})
+        if admin is None:
+            raise HTTPException(status_code=401, detail="Admin not found")
+        admin_id = admin["id"]
+        payload = {**admin_token_claims(admin), "ver": payload.get("ver", 0)}
+        admin_cache.set(admin)
     
-    return Admin(**admin)
+    if not payload.get("active", True):
+        raise HTTPException(status_code=401, detail="Admin account is inactive")
+    
+    # Hot path: the cached token version answers without touching MongoDB
+    state = admin_cache.get(admin_id)
+    if state is None:
+        admin = await db.admins.find_one({"id": admin_id}, {"_id": 0, "id": 1, "token_version": 1, "is_active": 1})
+        if admin is None:
+            raise HTTPException(status_code=401, detail="Admin not found")
+        admin_cache.set(admin)
+        state = admin_cache.get(admin_id)
+    
+    if not state["is_active"]:
+        raise HTTPException(status_code=401, detail="Admin account is inactive")
+    if payload.get("ver", 0) != state["token_version"]:
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+    
+    return AdminPrincipal(id=admin_id, username=username, role=payload.get("role", "admin"), token_version=state["token_version"])
 
 # Routes
 @api_router.get("/")
@@ -224,27 +1375,43 @@ async def root():
 
 # Product routes
 @api_router.get("/products", response_model=List[Product])
-async def get_products(category: Optional[str] = None, limit: int = 100):
+async def get_products(request: Request, category: Optional[str] = None, limit: int = 100):
     """Get all products or filter by category"""
+    # Normalized before they become part of the cache key; categories are stored lowercase
+    limit = max(1, min(limit, MAX_PRODUCT_LIST_LIMIT))
+    category = (category or "").strip().lower()
     query = {}
     if category and category != "todos":
         query["category"] = category
     
-    products = await db.products.find(query).sort("created_at", -1).limit(limit).to_list(limit)
-    return [Product.from_dict(product) for product in products]
+    cache_key = ("products", query.get("category"), limit)
+    cached = catalog_cache.get(cache_key)
+    if cached is None:
+        generation = catalog_cache.generation
+        products = await catalog_source().products.find(query).sort("created_at", -1).limit(limit).to_list(limit)
+        cached = CompressedBody(products_response(products).body)
+        # Compressed variants are added later and are smaller than the body; reserve room for them
+        catalog_cache.set(cache_key, cached, 2 * len(cached.body), generation)
+    return await cached_response(request, cached)
 
 @api_router.get("/products/{product_id}", response_model=Product)
 async def get_product(product_id: str):
     """Get a specific product by ID"""
-    product = await db.products.find_one({"id": product_id})
+    cached = catalog_cache.get(("product", product_id))
+    if cached is not None:
+        return cached
+    
+    generation = catalog_cache.generation
+    product = await catalog_source().products.find_one({"id": product_id})
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    return Product.from_dict(product)
+    product_obj = product_from_document(product)
+    catalog_cache.set(("product", product_id), product_obj, len(product_obj.model_dump_json()), generation)
+    return product_obj
 
-@api_router.post("/products", response_model=Product)
-async def create_product(product: ProductCreate, admin: Admin = Depends(get_current_admin)):
-    """Create a new product (admin only)"""
+def build_product(product: ProductCreate) -> Product:
+    """Validate a new product and apply backward compatibility rules"""
     # Validate category
     valid_categories = ["vestidos", "enterizos", "conjuntos", "blusas", "tops", "faldas", "pantalones"]
     if product.category not in valid_categories:
@@ -254,7 +1421,7 @@ async def create_product(product: ProductCreate, admin: Admin = Depends(get_curr
     if product.wholesale_price >= product.retail_price:
         raise HTTPException(status_code=400, detail="Wholesale price must be less than retail price")
     
-    product_dict = product.dict()
+    product_dict = product.model_dump()
     
     # Handle backward compatibility: if no images array but has image, add to images
     if not product_dict.get("images") and product_dict.get("image"):
@@ -269,22 +1436,11 @@ async def create_product(product: ProductCreate, admin: Admin = Depends(get_curr
     if product_dict.get("colors"):
         product_dict["colors"] = [color for color in product_dict["colors"] if color.strip()]
     
-    product_obj = Product(**product_dict)
-    
-    # Convert to dict for MongoDB storage
-    product_doc = product_obj.dict()
-    await db.products.insert_one(product_doc)
-    
-    return product_obj
+    return Product(**product_dict)
 
-@api_router.put("/products/{product_id}", response_model=Product)
-async def update_product(product_id: str, product_update: ProductUpdate, admin: Admin = Depends(get_current_admin)):
-    """Update a product (admin only)"""
-    existing_product = await db.products.find_one({"id": product_id})
-    if not existing_product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    
-    update_data = {k: v for k, v in product_update.dict().items() if v is not None}
+def build_product_update(product_update: ProductUpdate, existing_product: Optional[dict] = None) -> dict:
+    """Validate a product update and build the $set document; without existing_product use build_price_guard"""
+    update_data = product_update.model_dump(exclude_none=True)
     update_data["updated_at"] = datetime.utcnow()
     
     # Validate category if provided
@@ -294,9 +1450,9 @@ async def update_product(product_id: str, product_update: ProductUpdate, admin:
             raise HTTPException(status_code=400, detail="Invalid category")
     
     # Validate prices if provided
-    retail_price = update_data.get("retail_price", existing_product["retail_price"])
-    wholesale_price = update_data.get("wholesale_price", existing_product["wholesale_price"])
-    if wholesale_price >= retail_price:
+    retail_price = update_data.get("retail_price", (existing_product or {}).get("retail_price"))
+    wholesale_price = update_data.get("wholesale_price", (existing_product or {}).get("wholesale_price"))
+    if retail_price is not None and wholesale_price is not None and wholesale_price >= retail_price:
         raise HTTPException(status_code=400, detail="Wholesale price must be less than retail price")
     
     # Handle backward compatibility for images
@@ -311,79 +1467,547 @@ async def update_product(product_id: str, product_update: ProductUpdate, admin:
     if "colors" in update_data and update_data["colors"]:
         update_data["colors"] = [color for color in update_data["colors"] if color.strip()]
     
-    await db.products.update_one({"id": product_id}, {"$set": update_data})
+    # Keep the normalized lookup key in sync with the name
+    if "name" in update_data:
+        update_data["name_key"] = normalize_name_key(update_data["name"])
+    
+    return update_data
+
+def build_price_guard(update_data: dict) -> dict:
+    """Update filter conditions that keep wholesale_price below retail_price when only one price changes"""
+    if "retail_price" in update_data and "wholesale_price" in update_data:
+        return {}  # Both prices are new and already checked by build_product_update
+    if "retail_price" in update_data:
+        return {"wholesale_price": {"$lt": update_data["retail_price"]}}
+    if "wholesale_price" in update_data:
+        return {"retail_price": {"$gt": update_data["wholesale_price"]}}
+    return {}
+
+def write_timestamp() -> datetime:
+    """Current time truncated to MongoDB's millisecond precision"""
+    now = datetime.utcnow()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+async def unapplied_updates(product_ids: List[str], updated_at: datetime) -> Dict[str, HTTPException]:
+    """Guarded updates stamped with updated_at that matched nothing, by product id (cold path only)"""
+    stored = await db.products.find({"id": {"$in": product_ids}}, {"_id": 0, "id": 1, "updated_at": 1}).to_list(length=None)
+    stored_at = {product["id"]: product.get("updated_at") for product in stored}
+    failures = {}
+    for product_id in product_ids:
+        if product_id not in stored_at:
+            failures[product_id] = HTTPException(status_code=404, detail="Product not found")
+        elif stored_at[product_id] != updated_at:
+            failures[product_id] = HTTPException(status_code=409, detail="Wholesale price must be less than retail price")
+    return failures
+
+@api_router.post("/products", response_model=Product)
+async def create_product(product: ProductCreate, admin: AdminPrincipal = Depends(get_current_admin)):
+    """Create a new product (admin only)"""
+    product_obj = build_product(product)
+    
+    # Convert to dict for MongoDB storage
+    product_doc = product_to_document(product_obj)
+    try:
+        await db.products.insert_one(product_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="A product with this name already exists")
+    
+    cache_bus.publish("products", product_obj.id)
+    return product_obj
+
+@api_router.post("/products/bulk", response_model=BulkProductResult)
+async def bulk_write_products(bulk_request: BulkProductRequest, admin: AdminPrincipal = Depends(get_current_admin)):
+    """Create, update, upsert and delete many products in one call (admin only)"""
+    operations = bulk_request.operations
+    if len(operations) > MAX_BULK_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_OPERATIONS} operations are allowed per request")
+    
+    # Load every product referenced by id or (for upserts) by name with a single query
+    referenced_ids = list({op.id for op in operations if op.id})
+    referenced_keys = list({normalize_name_key(op.product.name) for op in operations
+                            if op.action == "upsert" and not op.id and op.product is not None})
+    existing_products = {}
+    existing_by_key = {}
+    if referenced_ids or referenced_keys:
+        found = await db.products.find(
+            {"$or": [{"id": {"$in": referenced_ids}}, {"name_key": {"$in": referenced_keys}}]},
+            {"_id": 0, "id": 1, "name_key": 1, "retail_price": 1, "wholesale_price": 1}
+        ).to_list(length=None)
+        existing_products = {product["id"]: product for product in found}
+        existing_by_key = {product["name_key"]: product for product in found if product.get("name_key")}
+    
+    # Validate everything in one pass; only valid operations reach MongoDB
+    results = []
+    write_requests = []
+    request_indexes = []
+    guarded_updates = {}  # results index -> product id of price-guarded updates
+    matched_upserts = set()
+    seen_ids = set()
+    batch_time = write_timestamp()  # tells which guarded updates applied
+    for index, op in enumerate(operations):
+        try:
+            if op.id in seen_ids:
+                raise HTTPException(status_code=409, detail="Only one operation per product is allowed in a request")
+            if op.action in ("create", "upsert"):
+                if op.product is None:
+                    raise HTTPException(status_code=400, detail=f"'{op.action}' requires a product")
+                product_obj = build_product(op.product)
+                matched = None
+                if op.id:
+                    product_obj.id = op.id
+                    matched = existing_products.get(op.id)
+                elif op.action == "upsert" and normalize_name_key(product_obj.name) in existing_by_key:
+                    matched = existing_by_key[normalize_name_key(product_obj.name)]
+                    product_obj.id = matched["id"]
+                product_doc = product_to_document(product_obj)
+                if op.action == "create":
+                    request = InsertOne(product_doc)
+                else:
+                    # An existing product only gets the fields the caller sent; the full document is for inserts
+                    update_data = {}
+                    if matched is not None:
+                        update_data = build_product_update(ProductUpdate(**op.product.model_dump(exclude_unset=True)), matched)
+                        update_data["updated_at"] = batch_time
+                        matched_upserts.add(index)
+                    insert_only = {key: value for key, value in product_doc.items() if key not in update_data}
+                    update = {"$setOnInsert": insert_only}
+                    if update_data:
+                        update["$set"] = update_data
+                    request = UpdateOne({"id": product_obj.id}, update, upsert=True)
+                product_id = product_obj.id
+            else:
+                if not op.id:
+                    raise HTTPException(status_code=400, detail=f"'{op.action}' requires a product id")
+                existing_product = existing_products.get(op.id)
+                if existing_product is None:
+                    raise HTTPException(status_code=404, detail="Product not found")
+                if op.action == "update":
+                    if op.changes is None:
+                        raise HTTPException(status_code=400, detail="'update' requires changes")
+                    update_data = build_product_update(op.changes, existing_product)
+                    update_data["updated_at"] = batch_time
+                    request = UpdateOne({"id": op.id, **build_price_guard(update_data)}, {"$set": update_data})
+                    guarded_updates[index] = op.id
+                else:
+                    request = DeleteOne({"id": op.id})
+                product_id = op.id
+            if product_id in seen_ids:
+                raise HTTPException(status_code=409, detail="Only one operation per product is allowed in a request")
+            seen_ids.add(product_id)
+        except HTTPException as e:
+            results.append(BulkItemResult(index=index, action=op.action, id=op.id, status="error",
+                                          status_code=e.status_code, message=e.detail))
+            continue
+        
+        results.append(BulkItemResult(index=index, action=op.action, id=product_id, status="success"))
+        write_requests.append(request)
+        request_indexes.append(index)
+    
+    # Apply all valid operations in a single unordered round-trip
+    upserted_indexes = set()
+    if write_requests:
+        try:
+            bulk_result = (await db.products.bulk_write(write_requests, ordered=False)).bulk_api_result
+        except BulkWriteError as e:
+            bulk_result = e.details
+            for write_error in e.details.get("writeErrors", []):
+                item = results[request_indexes[write_error["index"]]]
+                item.status = "error"
+                if write_error.get("code") == 11000:
+                    item.status_code = 400
+                    item.message = "A product with this name already exists"
+                else:
+                    item.status_code = 500
+                    item.message = write_error.get("errmsg", "Write failed")
+        upserted_indexes = {item["index"] for item in bulk_result.get("upserted", [])}
+        cache_bus.publish("products")
+        
+        # Cold path: some update filter matched nothing (price guard or concurrent delete)
+        expected_matches = len([index for index in request_indexes
+                                if results[index].status == "success" and results[index].action in ("update", "upsert")])
+        pending = {index: product_id for index, product_id in guarded_updates.items() if results[index].status == "success"}
+        if pending and bulk_result.get("nMatched", 0) + len(upserted_indexes) < expected_matches:
+            failures = await unapplied_updates(list(pending.values()), batch_time)
+            for index, product_id in pending.items():
+                if product_id in failures:
+                    item = results[index]
+                    item.status = "error"
+                    item.status_code = failures[product_id].status_code
+                    item.message = failures[product_id].detail
+    
+    for request_index, index in enumerate(request_indexes):
+        item = results[index]
+        if item.status == "success" and item.action == "upsert":
+            item.message = "created" if request_index in upserted_indexes and index not in matched_upserts else "updated"
+    
+    results.sort(key=lambda item: item.index)
+    succeeded = [item for item in results if item.status == "success"]
+    return BulkProductResult(
+        total_operations=len(operations),
+        created=len([item for item in succeeded if item.action == "create" or item.message == "created"]),
+        updated=len([item for item in succeeded if item.action == "update" or item.message == "updated"]),
+        deleted=len([item for item in succeeded if item.action == "delete"]),
+        failed=len(results) - len(succeeded),
+        results=results
+    )
+
+@api_router.put("/products/{product_id}", response_model=Product)
+async def update_product(product_id: str, product_update: ProductUpdate, admin: AdminPrincipal = Depends(get_current_admin)):
+    """Update a product (admin only)"""
+    update_data = build_product_update(product_update)
+    
+    # Single atomic round-trip: the price rule is enforced by the filter itself
+    try:
+        updated_product = await db.products.find_one_and_update(
+            {"id": product_id, **build_price_guard(update_data)},
+            {"$set": update_data},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="A product with this name already exists")
+    
+    if updated_product is None:
+        # Only on failure: tell a missing product apart from a rejected price change
+        if await db.products.count_documents({"id": product_id}, limit=1):
+            raise HTTPException(status_code=400, detail="Wholesale price must be less than retail price")
+        raise HTTPException(status_code=404, detail="Product not found")
     
-    updated_product = await db.products.find_one({"id": product_id})
-    return Product.from_dict(updated_product)
+    cache_bus.publish("products", product_id)
+    return product_from_document(updated_product)
 
 @api_router.delete("/products/{product_id}")
-async def delete_product(product_id: str, admin: Admin = Depends(get_current_admin)):
+async def delete_product(product_id: str, admin: AdminPrincipal = Depends(get_current_admin)):
     """Delete a product (admin only)"""
     result = await db.products.delete_one({"id": product_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
+    cache_bus.publish("products", product_id)
     
     return {"message": "Product deleted successfully"}
 
 @api_router.put("/products/{product_id}/stock/{size}")
-async def update_stock(product_id: str, size: str, stock_update: StockUpdate, admin: Admin = Depends(get_current_admin)):
+async def update_stock(product_id: str, size: str, stock_update: StockUpdate, admin: AdminPrincipal = Depends(get_current_admin)):
     """Update stock for a specific product size (admin only)"""
-    product = await db.products.find_one({"id": product_id})
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    
     # Update stock for the specific size
-    update_query = {f"stock.{size}": stock_update.quantity, "updated_at": datetime.utcnow()}
-    await db.products.update_one({"id": product_id}, {"$set": update_query})
+    update_query = {stock_field(size): stock_update.quantity, "updated_at": datetime.utcnow()}
+    result = await db.products.update_one({"id": product_id}, {"$set": update_query})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Product not found")
+    cache_bus.publish("products", product_id)
     
     return {"message": f"Stock updated for size {size}"}
 
+def stock_field(size: str) -> str:
+    """Dotted path for a size in the stock map, rejecting sizes that would escape it"""
+    if not size or "." in size or size.startswith("$"):
+        raise HTTPException(status_code=400, detail="Invalid size")
+    return f"stock.{size}"
+
+async def adjust_stock(product_id: str, size: str, delta: int) -> Optional[dict]:
+    """Atomically add delta to a size's stock; returns the new stock, or None if too few units remain"""
+    field = stock_field(size)
+    guard = {"$gte": -delta} if delta < 0 else {"$exists": True}
+    product = await db.products.find_one_and_update(
+        {"id": product_id, field: guard},
+        {"$inc": {field: delta}, "$set": {"updated_at": datetime.utcnow()}},
+        projection={"_id": 0, "stock": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if product is None:
+        return None
+    cache_bus.publish("products", product_id)
+    return product["stock"]
+
+async def stock_failure(product_id: str, size: str) -> HTTPException:
+    """Error for a guarded stock update that matched nothing (cold path only)"""
+    product = await db.products.find_one({"id": product_id}, {"_id": 0, "stock": 1})
+    if not product:
+        return HTTPException(status_code=404, detail="Product not found")
+    if size not in product.get("stock", {}):
+        return HTTPException(status_code=404, detail=f"Size {size} not found")
+    return HTTPException(status_code=409, detail="Insufficient stock")
+
+def merge_stock_lines(lines: List[StockReservationLine]) -> List[StockReservationLine]:
+    """Combine repeated product/size lines so each guard checks the full quantity"""
+    merged = {}
+    for line in lines:
+        key = (line.product_id, line.size)
+        if key in merged:
+            merged[key].quantity += line.quantity
+        else:
+            merged[key] = line.model_copy()
+    return list(merged.values())
+
+@api_router.post("/products/{product_id}/stock/reserve")
+async def reserve_stock(product_id: str, reservation: StockReservation, admin: AdminPrincipal = Depends(get_current_admin)):
+    """Atomically take units of a size out of stock (admin only)"""
+    stock = await adjust_stock(product_id, reservation.size, -reservation.quantity)
+    if stock is None:
+        raise await stock_failure(product_id, reservation.size)
+    
+    return {"product_id": product_id, "size": reservation.size, "remaining": stock[reservation.size]}
+
+@api_router.post("/products/{product_id}/stock/release")
+async def release_stock(product_id: str, reservation: StockReservation, admin: AdminPrincipal = Depends(get_current_admin)):
+    """Atomically return reserved units of a size to stock (admin only)"""
+    stock = await adjust_stock(product_id, reservation.size, reservation.quantity)
+    if stock is None:
+        raise await stock_failure(product_id, reservation.size)
+    
+    return {"product_id": product_id, "size": reservation.size, "remaining": stock[reservation.size]}
+
+@api_router.post("/stock/reserve")
+async def reserve_stock_batch(batch: StockBatchReservation, admin: AdminPrincipal = Depends(get_current_admin)):
+    """Reserve every line of a cart or none of them (admin only)"""
+    lines = merge_stock_lines(batch.lines)
+    for line in lines:
+        stock_field(line.size)
+    
+    # Each line is an independent guarded $inc; run them concurrently
+    stocks = await asyncio.gather(*[adjust_stock(line.product_id, line.size, -line.quantity) for line in lines])
+    failed = [line for line, stock in zip(lines, stocks) if stock is None]
+    
+    if failed:
+        # Compensate: give back the lines that did succeed, in one round-trip
+        reserved = [line for line, stock in zip(lines, stocks) if stock is not None]
+        unrestored = []
+        if reserved:
+            now = datetime.utcnow()
+            try:
+                await db.products.bulk_write(
+                    [UpdateOne({"id": line.product_id}, {"$inc": {stock_field(line.size): line.quantity}, "$set": {"updated_at": now}})
+                     for line in reserved],
+                    ordered=False
+                )
+            except BulkWriteError as e:
+                unrestored = [reserved[error["index"]] for error in e.details.get("writeErrors", [])]
+            except PyMongoError:
+                unrestored = reserved
+            cache_bus.publish("products")
+            for line in unrestored:
+                # These units stay reserved; they have to be released by hand
+                logger.error(f"Could not roll back reservation of {line.quantity} x {line.product_id} size {line.size}")
+        raise HTTPException(status_code=409, detail={
+            "message": "Could not reserve all lines",
+            "lines": [
+                {"product_id": line.product_id, "size": line.size, "quantity": line.quantity,
+                 "reason": (await stock_failure(line.product_id, line.size)).detail}
+                for line in failed
+            ],
+            "unrestored": [
+                {"product_id": line.product_id, "size": line.size, "quantity": line.quantity}
+                for line in unrestored
+            ]
+        })
+    
+    return {
+        "reserved": [
+            {"product_id": line.product_id, "size": line.size, "quantity": line.quantity, "remaining": stock[line.size]}
+            for line, stock in zip(lines, stocks)
+        ]
+    }
+
+@api_router.post("/stock/release")
+async def release_stock_batch(batch: StockBatchReservation, admin: AdminPrincipal = Depends(get_current_admin)):
+    """Return every line of a cancelled cart to stock (admin only)"""
+    lines = merge_stock_lines(batch.lines)
+    for line in lines:
+        stock_field(line.size)
+    
+    stocks = await asyncio.gather(*[adjust_stock(line.product_id, line.size, line.quantity) for line in lines])
+    results = []
+    for line, stock in zip(lines, stocks):
+        result = {"product_id": line.product_id, "size": line.size, "quantity": line.quantity}
+        if stock is None:
+            result.update(status="error", reason=(await stock_failure(line.product_id, line.size)).detail)
+        else:
+            result.update(status="success", remaining=stock[line.size])
+        results.append(result)
+    
+    return {"released": len([result for result in results if result["status"] == "success"]), "results": results}
+
 # Admin routes
 @api_router.post("/admin/register", response_model=dict)
-async def register_admin(admin_data: AdminCreate):
+async def register_admin(admin_data: AdminCreate, request: Request):
     """Register a new admin"""
+    await enforce_login_rate_limit(request, registration=True)
+    
     # Check if admin already exists
     existing_admin = await db.admins.find_one({"$or": [{"username": admin_data.username}, {"email": admin_data.email}]})
     if existing_admin:
         raise HTTPException(status_code=400, detail="Admin already exists")
     
     # Hash password
-    hashed_password = hash_password(admin_data.password)
+    hashed_password = await password_hasher.hash(admin_data.password)
     
     # Create admin
-    admin_dict = admin_data.dict()
+    admin_dict = admin_data.model_dump()
     admin_dict["password_hash"] = hashed_password
     del admin_dict["password"]
     
     admin_obj = Admin(**admin_dict)
-    await db.admins.insert_one(admin_obj.dict())
+    await db.admins.insert_one(admin_obj.model_dump())
     
     return {"message": "Admin registered successfully"}
 
 @api_router.post("/admin/login", response_model=Token)
-async def login_admin(login_data: AdminLogin):
+async def login_admin(login_data: AdminLogin, request: Request):
     """Admin login"""
+    await enforce_login_rate_limit(request, login_data.username)
+    
     admin = await db.admins.find_one({"username": login_data.username})
-    if not admin or not verify_password(login_data.password, admin["password_hash"]):
+    if not admin or not await password_hasher.verify(login_data.password, admin["password_hash"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     if not admin["is_active"]:
         raise HTTPException(status_code=401, detail="Admin account is inactive")
     
-    access_token = create_access_token(data={"sub": admin["username"]})
-    return {"access_token": access_token, "token_type": "bearer"}
+    admin_cache.set(admin)
+    return await issue_tokens(admin)
+
+@api_router.post("/admin/refresh", response_model=Token)
+async def refresh_admin_token(refresh_request: RefreshRequest):
+    """Exchange a refresh token for new tokens without checking the password again"""
+    token_hash = hash_refresh_token(refresh_request.refresh_token)
+    now = datetime.utcnow()
+    
+    # Rotation: each refresh token can be used exactly once
+    stored = await db.refresh_tokens.find_one_and_update(
+        {"token_hash": token_hash, "used": False, "expires_at": {"$gt": now}},
+        {"$set": {"used": True, "used_at": now}}
+    )
+    if stored is None:
+        reused = await db.refresh_tokens.find_one({"token_hash": token_hash, "used": True}, {"_id": 0, "family_id": 1})
+        if reused:
+            # A rotated token was presented again, so it may have been stolen: end the whole session
+            await db.refresh_tokens.update_many({"family_id": reused["family_id"]}, {"$set": {"used": True}})
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    
+    admin = await db.admins.find_one({"id": stored["admin_id"]}, {"_id": 0, "password_hash": 0})
+    if not admin or not admin.get("is_active", True) or admin.get("token_version", 0) != stored["token_version"]:
+        raise HTTPException(status_code=401, detail="Session has been revoked")
+    
+    admin_cache.set(admin)
+    return await issue_tokens(admin, stored["family_id"])
+
+@api_router.post("/admin/logout", response_model=dict)
+async def logout_admin(refresh_request: RefreshRequest):
+    """End the session that the refresh token belongs to"""
+    stored = await db.refresh_tokens.find_one({"token_hash": hash_refresh_token(refresh_request.refresh_token)}, {"_id": 0, "family_id": 1})
+    if stored:
+        await db.refresh_tokens.update_many({"family_id": stored["family_id"]}, {"$set": {"used": True}})
+    
+    return {"message": "Logged out successfully"}
 
 @api_router.get("/admin/me", response_model=dict)
-async def get_admin_profile(admin: Admin = Depends(get_current_admin)):
+async def get_admin_profile(admin: AdminPrincipal = Depends(get_current_admin)):
     """Get current admin profile"""
+    profile = await db.admins.find_one({"id": admin.id}, {"_id": 0})
+    if profile is None:
+        raise HTTPException(status_code=401, detail="Admin not found")
+    
     return {
-        "id": admin.id,
-        "username": admin.username,
-        "email": admin.email,
-        "created_at": admin.created_at,
-        "is_active": admin.is_active
+        "id": profile["id"],
+        "username": profile["username"],
+        "email": profile["email"],
+        "created_at": profile["created_at"],
+        "is_active": profile["is_active"]
     }
 
+@api_router.post("/admin/change-password", response_model=dict)
+async def change_admin_password(password_change: PasswordChange, admin: AdminPrincipal = Depends(get_current_admin)):
+    """Change the current admin's password and revoke every token issued so far"""
+    stored_admin = await db.admins.find_one({"id": admin.id}, {"_id": 0, "password_hash": 1})
+    if not stored_admin or not await password_hasher.verify(password_change.current_password, stored_admin["password_hash"]):
+        raise HTTPException(status_code=400, detail="Current password is incorrect")
+    
+    await revoke_admin_tokens(admin.id, {"password_hash": await password_hasher.hash(password_change.new_password)})
+    return {"message": "Password changed successfully, please log in again"}
+
+@api_router.get("/admin/debug/password-pool", response_model=dict)
+async def get_password_pool_stats(admin: AdminPrincipal = Depends(get_current_admin)):
+    """Queue depth and timings of the password hashing pool"""
+    return password_hasher.stats()
+
+@api_router.get("/admin/debug/mongo-pool", response_model=dict)
+async def get_mongo_pool_stats(admin: AdminPrincipal = Depends(get_current_admin)):
+    """Connection pool utilization and checkout wait times per MongoDB server"""
+    return mongo_pool_monitor.stats()
+
+@api_router.get("/admin/debug/cache", response_model=dict)
+async def get_cache_stats(admin: AdminPrincipal = Depends(get_current_admin)):
+    """Catalog cache hit rate and invalidation bus activity of this worker"""
+    return {"catalog": catalog_cache.stats(), "bus": cache_bus.stats()}
+
+@api_router.get("/admin/debug/event-loop", response_model=dict)
+async def get_event_loop_stats(admin: AdminPrincipal = Depends(get_current_admin)):
+    """Event loop lag of this worker and, with LOOP_BLOCK_DEBUG, how often it was blocked"""
+    return loop_lag_monitor.stats()
+
+@api_router.get("/admin/debug/queries", response_model=dict)
+async def get_query_profile(
+    admin: AdminPrincipal = Depends(get_current_admin),
+    limit: int = 20,
+    sort: Literal["total_ms", "avg_ms", "max_ms", "count"] = "total_ms",
+    reset: bool = False
+):
+    """Slowest query shapes per endpoint with their plans (requires QUERY_PROFILER=true)"""
+    if query_profiler is None:
+        return {"enabled": False, "shapes": 0, "dropped_shapes": 0, "queries": []}
+    report = query_profiler.report(limit, sort)
+    if reset:
+        query_profiler.reset()
+    return report
+
+@api_router.get("/admin/debug/profile")
+async def capture_profile(
+    admin: AdminPrincipal = Depends(get_current_admin),
+    seconds: float = 10,
+    interval_ms: float = 5,
+    format: Literal["speedscope", "collapsed"] = "speedscope"
+):
+    """Sample this worker's event loop for a few seconds and return a flamegraph file"""
+    if not settings.request_profiling:
+        raise HTTPException(status_code=403, detail="Profiling is disabled (set REQUEST_PROFILING=true)")
+    if not 0 < seconds <= settings.profile_max_seconds:
+        raise HTTPException(status_code=400, detail=f"seconds must be between 0 and {settings.profile_max_seconds:g}")
+    if profile_capture_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile capture is already running")
+    
+    async with profile_capture_lock:
+        sampler = StackSampler(threading.get_ident(), max(interval_ms, 0.5) / 1000)
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            sampler.stop()
+    return sampler.response(format, f"worker-{os.getpid()}")
+
+@api_router.get("/health/ready")
+async def readiness_check():
+    """Ready once the startup warm-up finished and MongoDB answers a ping; 503 otherwise"""
+    status = readiness.status()
+    try:
+        await asyncio.wait_for(db.command("ping"), timeout=2)
+        status["database"] = "ok"
+    except Exception as e:
+        status["database"] = f"error: {str(e)}"
+        status["ready"] = False
+    return ORJSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@api_router.post("/admin/{admin_id}/deactivate", response_model=dict)
+async def deactivate_admin(admin_id: str, admin: AdminPrincipal = Depends(get_current_admin)):
+    """Deactivate an admin account and revoke its tokens"""
+    if admin_id == admin.id:
+        raise HTTPException(status_code=400, detail="You cannot deactivate your own account")
+    
+    result = await revoke_admin_tokens(admin_id, {"is_active": False})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Admin not found")
+    
+    return {"message": "Admin deactivated successfully"}
+
 # Categories route
 @api_router.get("/categories")
 async def get_categories():
@@ -400,10 +2024,14 @@ async def get_categories():
 
 # Catalog Analytics routes (admin only)
 @api_router.get("/catalog/stats", response_model=CatalogStats)
-async def get_catalog_stats(admin: Admin = Depends(get_current_admin)):
+async def get_catalog_stats(admin: AdminPrincipal = Depends(get_current_admin)):
     """Get comprehensive catalog statistics"""
+    cached = catalog_cache.get(("stats",))
+    if cached is not None:
+        return cached
     
     # Get all products
+    generation = catalog_cache.generation
     products = await db.products.find().to_list(length=None)
     
     # Basic stats
@@ -434,16 +2062,18 @@ async def get_catalog_stats(admin: Admin = Depends(get_current_admin)):
         if total_stock < 5:
             low_stock_products.append(product.get("name", "Unknown"))
     
-    return CatalogStats(
+    stats = CatalogStats(
         total_products=total_products,
         products_by_category=products_by_category,
         total_stock_value_retail=total_stock_value_retail,
         total_stock_value_wholesale=total_stock_value_wholesale,
         low_stock_products=low_stock_products
     )
+    catalog_cache.set(("stats",), stats, len(stats.model_dump_json()), generation)
+    return stats
 
 @api_router.get("/catalog/low-stock")
-async def get_low_stock_products(admin: Admin = Depends(get_current_admin), threshold: int = 5):
+async def get_low_stock_products(admin: AdminPrincipal = Depends(get_current_admin), threshold: int = 5):
     """Get products with low stock"""
     products = await db.products.find().to_list(length=None)
     
@@ -464,7 +2094,7 @@ async def get_low_stock_products(admin: Admin = Depends(get_current_admin), thre
     return low_stock_products
 
 @api_router.get("/catalog/export")
-async def export_catalog(admin: Admin = Depends(get_current_admin), format: str = "json"):
+async def export_catalog(admin: AdminPrincipal = Depends(get_current_admin), format: str = "json"):
     """Export catalog data"""
     products = await db.products.find().to_list(length=None)
     
@@ -510,8 +2140,190 @@ async def search_products(query: str, category: Optional[str] = None, limit: int
     if category and category != "todos":
         search_filter["category"] = category
     
-    products = await db.products.find(search_filter).limit(limit).to_list(limit)
-    return [Product.from_dict(product) for product in products]
+    products = await catalog_db.products.find(search_filter).limit(limit).to_list(limit)
+    return products_response(products)
+
+# Catalog import helpers
+def iter_import_rows(upload: UploadFile):
+    """Yield (row_number, row) pairs from a CSV or XLSX upload one row at a time"""
+    filename = (upload.filename or "").lower()
+    if filename.endswith(".xlsx"):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise HTTPException(status_code=400, detail="XLSX import requires openpyxl to be installed")
+        workbook = load_workbook(upload.file, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [str(column or "").strip().lower() for column in next(rows, [])]
+            for row_number, values in enumerate(rows, start=2):
+                if any(value not in (None, "") for value in values):
+                    yield row_number, dict(zip(header, values))
+        finally:
+            workbook.close()
+    elif filename.endswith(".csv"):
+        reader = csv.DictReader(io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline=""))
+        if reader.fieldnames:
+            reader.fieldnames = [column.strip().lower() for column in reader.fieldnames]
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        raise HTTPException(status_code=400, detail="Unsupported file type, upload a .csv or .xlsx file")
+
+def parse_stock_cell(value: str) -> Dict[str, int]:
+    """Parse a stock cell such as 'S:5, M:3' into a size -> quantity dict"""
+    stock = {}
+    for entry in value.split(","):
+        if not entry.strip():
+            continue
+        size, separator, quantity = entry.partition(":")
+        if not separator or not size.strip():
+            raise ValueError(f"Invalid stock entry '{entry.strip()}', expected SIZE:QUANTITY")
+        try:
+            stock[size.strip()] = int(float(quantity))
+        except ValueError:
+            raise ValueError(f"Invalid stock quantity for size '{size.strip()}'")
+    return stock
+
+def parse_import_row(raw_row: dict) -> dict:
+    """Turn a raw spreadsheet row into product fields, skipping empty cells and unknown columns"""
+    row = {}
+    for column, value in raw_row.items():
+        if column is None or value is None:
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+            if not value:
+                continue
+        if column in IMPORT_TEXT_FIELDS:
+            row[column] = str(value)
+        elif column in IMPORT_PRICE_FIELDS:
+            try:
+                price = float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid {column} '{value}'")
+            row[column] = int(price) if price.is_integer() else price
+        elif column in IMPORT_LIST_FIELDS:
+            row[column] = [item.strip() for item in str(value).split(",") if item.strip()]
+        elif column == "stock":
+            row[column] = parse_stock_cell(str(value))
+    if not row.get("name"):
+        raise ValueError("Missing product name")
+    return row
+
+def format_validation_error(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(loc) for loc in item['loc'])}: {item['msg']}" for item in error.errors())
+
+async def apply_import_batch(batch: list, seen_keys: set, result: CatalogImportResult):
+    """Validate and diff one batch of rows against the catalog, then write it with one bulk_write"""
+    parsed_rows = []
+    for row_number, raw_row in batch:
+        try:
+            row = parse_import_row(raw_row)
+            name_key = normalize_name_key(row["name"])
+            if name_key in seen_keys:
+                raise ValueError("Product appears more than once in the file")
+            seen_keys.add(name_key)
+            parsed_rows.append((row_number, name_key, row))
+        except ValueError as e:
+            result.errors.append(ImportRowError(row=row_number, name=str(raw_row.get("name") or ""), message=str(e)))
+    
+    # Diff against the current catalog with one indexed query per batch
+    existing = await db.products.find(
+        {"name_key": {"$in": [name_key for _, name_key, _ in parsed_rows]}},
+        {"_id": 0}
+    ).to_list(length=None)
+    existing_by_key = {product["name_key"]: product for product in existing}
+    
+    write_requests = []
+    written_rows = []
+    batch_time = write_timestamp()
+    for row_number, name_key, row in parsed_rows:
+        existing_product = existing_by_key.get(name_key)
+        try:
+            if existing_product is None:
+                row.setdefault("description", "")
+                write_requests.append(InsertOne(product_to_document(build_product(ProductCreate(**row)))))
+                written_rows.append((row_number, row["name"], "created", None))
+            else:
+                changes = {field: value for field, value in row.items() if existing_product.get(field) != value}
+                if not changes:
+                    result.unchanged += 1
+                    continue
+                update_data = build_product_update(ProductUpdate(**changes), existing_product)
+                update_data["updated_at"] = batch_time
+                write_requests.append(UpdateOne({"id": existing_product["id"], **build_price_guard(update_data)}, {"$set": update_data}))
+                written_rows.append((row_number, row["name"], "updated", existing_product["id"]))
+        except ValidationError as e:
+            result.errors.append(ImportRowError(row=row_number, name=row["name"], message=format_validation_error(e)))
+        except HTTPException as e:
+            result.errors.append(ImportRowError(row=row_number, name=row["name"], message=e.detail))
+        except TypeError:
+            # Legacy products may store prices as strings, which cannot be compared with the new ones
+            result.errors.append(ImportRowError(row=row_number, name=row["name"],
+                                                message="Stored product has invalid prices, fix it before importing"))
+    
+    failed_indexes = set()
+    if write_requests and not result.dry_run:
+        try:
+            bulk_result = (await db.products.bulk_write(write_requests, ordered=False)).bulk_api_result
+        except BulkWriteError as e:
+            bulk_result = e.details
+            for write_error in e.details.get("writeErrors", []):
+                failed_indexes.add(write_error["index"])
+                row_number, name, _, _ = written_rows[write_error["index"]]
+                result.errors.append(ImportRowError(row=row_number, name=name, message=write_error.get("errmsg", "Write failed")))
+        cache_bus.publish("products")
+        
+        # Cold path: a price guard or a concurrent delete kept some update from applying
+        pending = {index: product_id for index, (_, _, status, product_id) in enumerate(written_rows)
+                   if status == "updated" and index not in failed_indexes}
+        if pending and bulk_result.get("nMatched", 0) < len(pending):
+            failures = await unapplied_updates(list(pending.values()), batch_time)
+            for index, product_id in pending.items():
+                if product_id in failures:
+                    failed_indexes.add(index)
+                    row_number, name, _, _ = written_rows[index]
+                    result.errors.append(ImportRowError(row=row_number, name=name, message=failures[product_id].detail))
+    
+    for index, (_, _, status, _) in enumerate(written_rows):
+        if index not in failed_indexes:
+            if status == "created":
+                result.created += 1
+            else:
+                result.updated += 1
+
+@api_router.post("/catalog/import", response_model=CatalogImportResult)
+async def import_catalog(file: UploadFile = File(...), dry_run: bool = False, admin: AdminPrincipal = Depends(get_current_admin)):
+    """Import products from a CSV or XLSX sheet, creating new products and updating changed ones (admin only)"""
+    rows = iter_import_rows(file)
+    result = CatalogImportResult(total_rows=0, created=0, updated=0, unchanged=0, failed=0, dry_run=dry_run, errors=[])
+    seen_keys = set()
+    
+    while True:
+        # Parse the next batch off the event loop so large sheets don't stall other requests
+        batch = await asyncio.to_thread(list, itertools.islice(rows, IMPORT_BATCH_SIZE))
+        if not batch:
+            break
+        result.total_rows += len(batch)
+        await apply_import_batch(batch, seen_keys, result)
+    
+    result.failed = len(result.errors)
+    result.errors.sort(key=lambda error: error.row)
+    return result
+
+# Outgoing HTTP calls; benchmarks set this to a transport serving local fakes
+upstream_transport = None
+OFFLOAD_ENCODE_MIN_BYTES = 1024 * 1024  # base64 runs at ~300MB/s: 1MB holds the loop ~3ms
+
+def upstream_client(**kwargs) -> httpx.AsyncClient:
+    if settings.tracing_exporter != "none":
+        # The client only applies `limits` to the transport it creates itself
+        transport = upstream_transport or httpx.AsyncHTTPTransport(
+            limits=kwargs.pop("limits", httpx.Limits(max_connections=100, max_keepalive_connections=20))
+        )
+        return httpx.AsyncClient(transport=TracingTransport(transport), **kwargs)
+    return httpx.AsyncClient(transport=upstream_transport, **kwargs)
 
 # Image Proxy Endpoint to solve CORS issues
 @api_router.get("/proxy-image")
@@ -540,6 +2352,7 @@ async def proxy_image(url: str):
         from urllib.parse import urlparse
         parsed_url = urlparse(url)
         domain = parsed_url.netloc.lower()
+        trace.get_current_span().set_attribute("image.host", domain)
         
         # Check if domain is allowed
         if not any(allowed_domain in domain for allowed_domain in allowed_domains):
@@ -557,7 +2370,7 @@ async def proxy_image(url: str):
             'Upgrade-Insecure-Requests': '1'
         }
         
-        async with httpx.AsyncClient(
+        async with upstream_client(
             timeout=timeout,
             headers=headers,
             follow_redirects=True,
@@ -570,8 +2383,14 @@ async def proxy_image(url: str):
             
             for attempt in range(max_retries + 1):
                 try:
-                    print(f"Attempting to fetch image (attempt {attempt + 1}): {url}")
-                    response = await client.get(url)
+                    logger.debug("Fetching image", extra={"fields": {"url": url, "attempt": attempt + 1}})
+                    fetch_started = time.perf_counter()
+                    try:
+                        response = await client.get(url)
+                    except httpx.RequestError:
+                        upstream_request_duration_seconds.labels("image_proxy", "error").observe(time.perf_counter() - fetch_started)
+                        raise
+                    upstream_request_duration_seconds.labels("image_proxy", str(response.status_code)).observe(time.perf_counter() - fetch_started)
                     
                     if response.status_code == 200:
                         # Determine content type
@@ -579,14 +2398,16 @@ async def proxy_image(url: str):
                         
                         # Ensure it's an image or allow certain content types
                         if not (content_type.startswith("image/") or content_type.startswith("application/octet-stream")):
-                            print(f"Content-Type not image: {content_type}")
+                            logger.warning("Proxied URL is not an image", extra={"fields": {"url": url, "content_type": content_type}})
                             # Try anyway for some cases
                             if len(response.content) > 1000:  # Likely an image if > 1KB
                                 content_type = "image/jpeg"
                             else:
                                 raise HTTPException(status_code=400, detail=f"URL does not point to an image. Content-Type: {content_type}")
                         
-                        print(f"Successfully fetched image: {len(response.content)} bytes, Content-Type: {content_type}")
+                        logger.info("Fetched image", extra={"sampled": True, "fields": {
+                            "url": url, "bytes": len(response.content), "content_type": content_type, "attempt": attempt + 1
+                        }})
                         
                         # Return the image with proper headers
                         return Response(
@@ -601,14 +2422,16 @@ async def proxy_image(url: str):
                             }
                         )
                     else:
-                        print(f"HTTP {response.status_code} response for: {url}")
+                        logger.warning("Image source returned an error", extra={"fields": {
+                            "url": url, "status": response.status_code, "attempt": attempt + 1
+                        }})
                         if attempt < max_retries:
                             await asyncio.sleep(1)  # Wait before retry
                             continue
                         raise HTTPException(status_code=response.status_code, detail=f"Failed to fetch image: HTTP {response.status_code}")
                         
                 except httpx.TimeoutException as e:
-                    print(f"Timeout on attempt {attempt + 1} for {url}: {str(e)}")
+                    logger.warning("Image fetch timed out", extra={"fields": {"url": url, "attempt": attempt + 1, "error": str(e)}})
                     last_error = e
                     if attempt < max_retries:
                         await asyncio.sleep(1)
@@ -616,7 +2439,7 @@ async def proxy_image(url: str):
                     raise HTTPException(status_code=408, detail="Image request timed out")
                 
                 except httpx.RequestError as e:
-                    print(f"Request error on attempt {attempt + 1} for {url}: {str(e)}")
+                    logger.warning("Image fetch failed", extra={"fields": {"url": url, "attempt": attempt + 1, "error": str(e)}})
                     last_error = e
                     if attempt < max_retries:
                         await asyncio.sleep(1)
@@ -629,7 +2452,7 @@ async def proxy_image(url: str):
     except HTTPException:
         raise  # Re-raise HTTP exceptions as-is
     except Exception as e:
-        print(f"Unexpected error in proxy_image: {str(e)}")
+        logger.exception("Unexpected error in proxy_image", extra={"fields": {"url": url}})
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 # Mass Image Upload endpoint
@@ -637,7 +2460,7 @@ async def proxy_image(url: str):
 async def mass_upload_images(
     files: List[UploadFile] = File(...),
     product_names: str = Form(...),
-    current_user: dict = Depends(get_current_admin)
+    current_user: AdminPrincipal = Depends(get_current_admin)
 ):
     """
     Upload multiple images to ImgBB and update products automatically
@@ -654,58 +2477,74 @@ async def mass_upload_images(
         results = []
         successful_uploads = 0
         
-        for i, (file, product_name) in enumerate(zip(files, product_names_list)):
+        # Resolve the whole batch of product names with a single indexed query
+        name_keys = [normalize_name_key(name) for name in product_names_list]
+        matched_products = await db.products.find(
+            {"name_key": {"$in": list(set(name_keys))}},
+            {"_id": 0, "id": 1, "name_key": 1}
+        ).to_list(length=None)
+        products_by_key = {product["name_key"]: product for product in matched_products}
+        
+        for i, (file, product_name, name_key) in enumerate(zip(files, product_names_list, name_keys)):
             try:
+                product = products_by_key.get(name_key)
+                if not product:
+                    results.append({
+                        "product_name": product_name,
+                        "status": "error",
+                        "message": f"Product '{product_name}' not found in database"
+                    })
+                    continue
+                
                 # Read file content
                 contents = await file.read()
                 
-                # Upload to ImgBB
-                import base64
-                image_base64 = base64.b64encode(contents).decode('utf-8')
+                # Upload to ImgBB; only large photos are worth encoding off the event loop
+                if len(contents) >= OFFLOAD_ENCODE_MIN_BYTES:
+                    image_base64 = await asyncio.to_thread(lambda: base64.b64encode(contents).decode('utf-8'))
+                else:
+                    image_base64 = base64.b64encode(contents).decode('utf-8')
                 
-                async with httpx.AsyncClient(timeout=30.0) as client:
+                async with upstream_client(timeout=30.0) as client:
                     data = {
-                        'key': IMGBB_API_KEY,
+                        'key': settings.imgbb_api_key,
                         'image': image_base64,
                         'name': f"hannu_{product_name.replace(' ', '_')}"
                     }
                     
-                    response = await client.post('https://api.imgbb.com/1/upload', data=data)
+                    upload_started = time.perf_counter()
+                    try:
+                        response = await client.post('https://api.imgbb.com/1/upload', data=data)
+                    except httpx.RequestError:
+                        upstream_request_duration_seconds.labels("imgbb", "error").observe(time.perf_counter() - upload_started)
+                        raise
+                    upstream_request_duration_seconds.labels("imgbb", str(response.status_code)).observe(time.perf_counter() - upload_started)
                     
                     if response.status_code == 200:
                         result = response.json()
                         if result.get('success'):
                             imgbb_url = result['data']['url']
                             
-                            # Find and update product in database
-                            product = await db.products.find_one({"name": {"$regex": f"^{product_name}$", "$options": "i"}})
+                            # Update product with new image
+                            update_data = {
+                                "images": [imgbb_url],
+                                "image": imgbb_url,  # For compatibility
+                                "updated_at": datetime.utcnow()
+                            }
                             
-                            if product:
-                                # Update product with new image
-                                update_data = {
-                                    "images": [imgbb_url],
-                                    "image": imgbb_url,  # For compatibility
-                                    "updated_at": datetime.utcnow()
-                                }
-                                
-                                await db.products.update_one(
-                                    {"id": product["id"]},
-                                    {"$set": update_data}
-                                )
-                                
-                                results.append({
-                                    "product_name": product_name,
-                                    "status": "success",
-                                    "imgbb_url": imgbb_url,
-                                    "message": "Image uploaded and product updated"
-                                })
-                                successful_uploads += 1
-                            else:
-                                results.append({
-                                    "product_name": product_name,
-                                    "status": "error",
-                                    "message": f"Product '{product_name}' not found in database"
-                                })
+                            await db.products.update_one(
+                                {"id": product["id"]},
+                                {"$set": update_data}
+                            )
+                            cache_bus.publish("products", product["id"])
+                            
+                            results.append({
+                                "product_name": product_name,
+                                "status": "success",
+                                "imgbb_url": imgbb_url,
+                                "message": "Image uploaded and product updated"
+                            })
+                            successful_uploads += 1
                         else:
                             results.append({
                                 "product_name": product_name,
@@ -726,6 +2565,9 @@ async def mass_upload_images(
                     "message": f"Upload error: {str(e)}"
                 })
         
+        span = trace.get_current_span()
+        span.set_attribute("upload.files", len(files))
+        span.set_attribute("upload.successful", successful_uploads)
         return {
             "total_files": len(files),
             "successful_uploads": successful_uploads,
@@ -735,68 +2577,687 @@ async def mass_upload_images(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Mass upload error: {str(e)}")
 
-# Include the router in the main app
-app.include_router(api_router)
+# Configure logging
+# Handlers write to stdout on a background thread: the event loop only puts records on a queue
+request_id_var = contextvars.ContextVar("request_id", default=None)
+request_scope_var = contextvars.ContextVar("request_scope", default=None)  # ASGI scope; the route is filled in by routing
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+class RequestContextFilter(logging.Filter):
+    """Stamps each record with the current request's correlation id"""
+    
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+class SamplingFilter(logging.Filter):
+    """Keeps a share of records logged with extra={"sampled": True}; warnings and errors always pass"""
+    
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+    
+    def filter(self, record):
+        if not getattr(record, "sampled", False) or record.levelno >= logging.WARNING:
+            return True
+        return random.random() < self.rate
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; fields passed as extra={"fields": {...}} are merged in"""
+    
+    def format(self, record):
+        entry = {
+            "ts": datetime.utcfromtimestamp(record.created).isoformat(timespec="milliseconds") + "Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return orjson.dumps(entry, default=str).decode()
+
+class QueueLogHandler(logging.handlers.QueueHandler):
+    """Leaves formatting to the listener thread; only the message arguments are resolved here"""
+    
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+log_listener = None
+
+def configure_logging(app_settings: Settings):
+    """Process-wide, so the first app created sets it up"""
+    global log_listener
+    if log_listener is not None:
+        return
+    
+    stream_handler = logging.StreamHandler()
+    if app_settings.log_format == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueLogHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(app_settings.log_sample_rate))
+    queue_handler.addFilter(RequestContextFilter())
+    
+    root_logger = logging.getLogger()
+    root_logger.setLevel(app_settings.log_level)
+    root_logger.addHandler(queue_handler)
+    # httpx logs every outgoing request at INFO; the proxy logs its own sampled events
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    
+    log_listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    log_listener.start()
+    atexit.register(log_listener.stop)  # drain the queue before the process exits
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
-@app.on_event("startup")
-async def startup_event():
-    logger.info("HANNU CLOTHES CATALOG API starting up...")
-    
-    # Create default admin if none exists
-    admin_count = await db.admins.count_documents({})
-    if admin_count == 0:
-        default_admin = Admin(
-            username="admin",
-            email="admin@hannuclothes.com",
-            password_hash=hash_password("admin123")
-        )
-        await db.admins.insert_one(default_admin.dict())
-        logger.info("Default admin created: username=admin, password=admin123")
-    
-    # Create sample products if none exist
-    product_count = await db.products.count_documents({})
-    if product_count == 0:
-        sample_products = [
-            {
-                "id": str(uuid.uuid4()),
-                "name": "Vestido Rosa Elegante",
-                "description": "Vestido elegante perfecto para ocasiones especiales. Confeccionado en tela de alta calidad con acabados refinados.",
-                "retail_price": 150000,
-                "wholesale_price": 105000,
-                "category": "vestidos",
-                "image": "https://images.unsplash.com/photo-1633077705107-8f53a004218f?crop=entropy&cs=srgb&fm=jpg&ixid=M3w3NTY2Nzd8MHwxfHNlYXJjaHwyfHx3b21lbiUyMGRyZXNzZXN8ZW58MHx8fHwxNzU2OTk5NjU1fDA&ixlib=rb-4.1.0&q=85",
-                "specifications": "Vestido de corte A, manga corta, cuello redondo, cierre posterior invisible",
-                "composition": "95% Algodón, 5% Elastano",
-                "care": "Lavar a máquina en agua fría, no usar blanqueador, planchar a temperatura media",
-                "shipping_policy": "Envío nacional 2-5 días hábiles. Envío gratis en compras superiores a $200.000",
-                "exchange_policy": "Cambios y devoluciones hasta 15 días después de la compra. El producto debe estar en perfectas condiciones.",
-                "sizes": ["XS", "S", "M", "L", "XL"],
-                "stock": {"XS": 5, "S": 8, "M": 12, "L": 10, "XL": 6},
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            }
-        ]
+class RequestContextMiddleware:
+    """ASGI middleware giving each request a correlation id (X-Request-ID) for logs and responses"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", []).append((b"x-request-id", request_id.encode("latin-1")))
+            await send(message)
+        
+        token = request_id_var.set(request_id)
+        scope_token = request_scope_var.set(scope)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_scope_var.reset(scope_token)
+            request_id_var.reset(token)
+
+STDLIB_DIR = os.path.dirname(os.__file__)
+
+def frame_location(code) -> tuple:
+    """(function, file, first line) of a code object; paths are shortened to the app or package"""
+    filename = code.co_filename
+    if filename.startswith(str(ROOT_DIR)):
+        filename = os.path.relpath(filename, ROOT_DIR)
+    elif "site-packages" in filename:
+        filename = filename.split("site-packages" + os.sep, 1)[-1]
+    elif filename.startswith(STDLIB_DIR):
+        filename = os.path.relpath(filename, STDLIB_DIR)
+    return (code.co_qualname, filename, code.co_firstlineno)
+
+class StackSampler:
+    """Statistical profiler sampling the event loop thread's stack from a background thread"""
+    
+    def __init__(self, thread_id: int, interval: float, loop=None, task=None, max_depth: int = 128):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.loop = loop
+        self.task = task
+        self.max_depth = max_depth
+        self.stacks = {}  # tuple of frame locations, root first -> seconds
+        self.samples = 0
+        self.started_at = None
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def current_stack(self) -> tuple:
+        if self.task is not None:
+            current = asyncio.current_task(self.loop)
+            if current is None:
+                return (("[idle]", "", 0),)
+            if current is not self.task:
+                return (("[other tasks]", "", 0),)
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            stack.append(frame_location(frame.f_code))
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
+    
+    def run(self):
+        last = self.started_at
+        while not self._stop.wait(self.interval):
+            stack = self.current_stack()
+            now = time.perf_counter()
+            self.stacks[stack] = self.stacks.get(stack, 0.0) + now - last
+            self.samples += 1
+            last = now
+    
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self.run, name="stack-sampler", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+    
+    def collapsed(self) -> str:
+        """One `frame;frame;frame microseconds` line per stack, the input format of flamegraph.pl"""
+        lines = []
+        for stack, seconds in sorted(self.stacks.items(), key=lambda item: -item[1]):
+            frames = ";".join(f"{name} ({filename}:{line})" if filename else name for name, filename, line in stack)
+            lines.append(f"{frames} {round(seconds * 1_000_000)}")
+        return "\n".join(lines) + "\n"
+    
+    def speedscope(self, name: str) -> dict:
+        """Sampled profile in the speedscope file format (https://www.speedscope.app)"""
+        frame_index = {}
+        samples = []
+        weights = []
+        for stack, seconds in self.stacks.items():
+            samples.append([frame_index.setdefault(location, len(frame_index)) for location in stack])
+            weights.append(seconds)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "hannu-clothes-api",
+            "shared": {"frames": [{"name": frame_name, "file": filename, "line": line} if filename else {"name": frame_name}
+                                  for frame_name, filename, line in frame_index]},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights
+            }]
+        }
+    
+    def response(self, format: str, name: str) -> Response:
+        headers = {
+            "X-Profile-Samples": str(self.samples),
+            "X-Profile-Duration-Ms": str(round(self.duration * 1000, 2))
+        }
+        if format == "collapsed":
+            headers["Content-Disposition"] = f'attachment; filename="{name}.collapsed.txt"'
+            return Response(self.collapsed(), media_type="text/plain", headers=headers)
+        headers["Content-Disposition"] = f'attachment; filename="{name}.speedscope.json"'
+        return Response(orjson.dumps(self.speedscope(name)), media_type="application/json", headers=headers)
+
+profile_capture_lock = asyncio.Lock()
+
+class ProfilingMiddleware:
+    """Answers with a flamegraph of the request when an admin sends X-Profile or ?profile="""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    def requested_format(self, scope) -> Optional[str]:
+        value = None
+        for name, header_value in scope["headers"]:
+            if name == b"x-profile":
+                value = header_value.decode("latin-1")
+                break
+        if value is None:
+            value = Request(scope).query_params.get("profile")
+        if value is None or value.lower() in ("", "0", "false"):
+            return None
+        return "collapsed" if value.lower() == "collapsed" else "speedscope"
+    
+    async def is_admin(self, scope) -> bool:
+        authorization = Request(scope).headers.get("authorization", "")
+        scheme, _, token = authorization.partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return False
+        try:
+            await get_current_admin(HTTPAuthorizationCredentials(scheme=scheme, credentials=token))
+        except HTTPException:
+            return False
+        return True
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.request_profiling:
+            await self.app(scope, receive, send)
+            return
+        format = self.requested_format(scope)
+        if format is None or not await self.is_admin(scope):
+            await self.app(scope, receive, send)
+            return
+        
+        status = 500
+        
+        async def discard_response(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+        
+        sampler = StackSampler(threading.get_ident(), settings.profile_sample_interval_ms / 1000,
+                               loop=asyncio.get_running_loop(), task=asyncio.current_task())
+        sampler.start()
+        try:
+            await self.app(scope, receive, discard_response)
+        finally:
+            sampler.stop()
+        
+        name = f"{scope['method']} {scope['path']}"
+        logger.info(f"Profiled {name}: {sampler.samples} samples in {sampler.duration * 1000:.1f}ms")
+        response = sampler.response(format, f"request-{request_id_var.get() or uuid.uuid4().hex}")
+        response.headers["X-Profiled-Status"] = str(status)
+        await response(scope, receive, send)
+
+class LoopLagMonitor:
+    """Event loop lag from a sleeping probe; in debug mode logs the stack holding the loop"""
+    
+    def __init__(self, interval: float, debug: bool = False, threshold: float = 0.1):
+        self.debug = debug
+        self.threshold = threshold
+        # The heartbeat has to be finer than the threshold for stalls to be told apart from sleeps
+        self.interval = min(interval, threshold / 2) if debug else interval
+        self.samples = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.blocks = 0
+        self.heartbeat = None
+        self.loop = None
+        self.loop_thread_id = None
+        self._task = None
+        self._watchdog = None
+        self._stop = threading.Event()
+    
+    async def probe(self):
+        while True:
+            expected = self.loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, self.loop.time() - expected)
+            self.heartbeat = time.perf_counter()
+            self.samples += 1
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            event_loop_lag_seconds.observe(lag)
+    
+    def watch(self):
+        reported = None
+        while not self._stop.wait(self.threshold / 4):
+            heartbeat = self.heartbeat
+            stalled = time.perf_counter() - heartbeat - self.interval
+            if stalled < self.threshold or heartbeat == reported:
+                continue
+            reported = heartbeat
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            task = asyncio.current_task(self.loop)
+            coroutine = task.get_coro().__qualname__ if task is not None else "loop callback"
+            self.blocks += 1
+            event_loop_blocks_total.inc()
+            logger.warning(
+                f"Event loop blocked for at least {stalled * 1000:.0f}ms in {coroutine}\n{''.join(traceback.format_stack(frame))}",
+                extra={"fields": {"blocked_ms": round(stalled * 1000, 1), "task": coroutine}}
+            )
+    
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = time.perf_counter()
+        self._task = asyncio.create_task(self.probe())
+        if self.debug:
+            self._stop.clear()
+            self._watchdog = threading.Thread(target=self.watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+    
+    def stats(self) -> dict:
+        return {
+            "interval_ms": round(self.interval * 1000, 1),
+            "samples": self.samples,
+            "last_lag_ms": round(self.last_lag * 1000, 2),
+            "max_lag_ms": round(self.max_lag * 1000, 2),
+            "block_debug": self.debug,
+            "blocks": self.blocks
+        }
+    
+    async def stop(self):
+        if self._watchdog is not None:
+            self._stop.set()
+            self._watchdog.join()
+            self._watchdog = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+loop_lag_monitor = None  # set up by configure()
+
+# Tracing (OpenTelemetry); with TRACING_EXPORTER=none the tracer calls are no-ops
+tracer_provider = None
+
+def configure_tracing(app_settings: Settings):
+    """Process-wide, so the first app created with tracing enabled installs the provider"""
+    global tracer_provider
+    if tracer_provider is not None or app_settings.tracing_exporter == "none":
+        return
+    
+    if app_settings.tracing_exporter == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        exporter = OTLPSpanExporter()  # endpoint and headers from the standard OTEL_EXPORTER_OTLP_* variables
+    elif app_settings.tracing_exporter == "console":
+        exporter = ConsoleSpanExporter()
+    else:
+        raise ValueError(f"Unknown TRACING_EXPORTER: {app_settings.tracing_exporter}")
+    
+    tracer_provider = TracerProvider(
+        resource=Resource.create({"service.name": os.environ.get("OTEL_SERVICE_NAME", "hannu-catalog-api")}),
+        sampler=ParentBased(TraceIdRatioBased(app_settings.tracing_sample_ratio))
+    )
+    # Spans are exported in batches from a background thread, off the request path
+    tracer_provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(tracer_provider)
+
+tracer = trace.get_tracer("hannu.catalog")
+
+# Path parameters recorded on the request span under a domain attribute name
+TRACED_PATH_PARAMS = {"product_id": "product.id", "admin_id": "admin.id", "size": "product.size"}
+
+class TracingMiddleware:
+    """ASGI middleware opening a server span per request, continuing an incoming trace"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+        method = scope["method"]
+        status = 500
         
-        for product in sample_products:
-            await db.products.insert_one(product)
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
         
-        logger.info(f"Created {len(sample_products)} sample products")
+        with tracer.start_as_current_span(
+            method,
+            context=propagate.extract(headers),
+            kind=SpanKind.SERVER,
+            attributes={"http.request.method": method, "url.path": scope["path"], "request.id": request_id_var.get() or ""}
+        ) as span:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get("route")
+                if route is not None:
+                    span.update_name(f"{method} {route.path}")
+                    span.set_attribute("http.route", route.path)
+                for name, value in scope.get("path_params", {}).items():
+                    if name in TRACED_PATH_PARAMS:
+                        span.set_attribute(TRACED_PATH_PARAMS[name], value)
+                span.set_attribute("http.response.status_code", status)
+                if status >= 500:
+                    span.set_status(Status(StatusCode.ERROR))
+
+class MongoCommandTracer(monitoring.CommandListener):
+    """Client span per MongoDB command"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans = {}
+    
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        collection = collection if isinstance(collection, str) else ""
+        attributes = {
+            "db.system": "mongodb",
+            "db.namespace": event.database_name,
+            "db.operation.name": event.command_name,
+            "db.collection.name": collection,
+            "server.address": str(event.connection_id[0]) if event.connection_id else "",
+        }
+        if isinstance(event.command.get("filter"), dict):
+            attributes["db.query.shape"] = orjson.dumps(query_shape(event.command["filter"])).decode()
+        span = tracer.start_span(f"{event.command_name} {collection}".strip(), kind=SpanKind.CLIENT, attributes=attributes)
+        with self._lock:
+            self._spans[event.request_id] = span
+    
+    def _finished(self, event):
+        with self._lock:
+            return self._spans.pop(event.request_id, None)
+    
+    def succeeded(self, event):
+        span = self._finished(event)
+        if span is not None:
+            span.end()
+    
+    def failed(self, event):
+        span = self._finished(event)
+        if span is not None:
+            failure = event.failure if isinstance(event.failure, dict) else {}
+            span.set_status(Status(StatusCode.ERROR, str(failure.get("errmsg", "command failed"))))
+            span.end()
+
+mongo_command_tracer = MongoCommandTracer()
+
+class TracingTransport(httpx.AsyncBaseTransport):
+    """Transport wrapper adding a client span per outgoing request"""
+    
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+    
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        with tracer.start_as_current_span(
+            f"{request.method} {request.url.host}",
+            kind=SpanKind.CLIENT,
+            attributes={"http.request.method": request.method, "server.address": request.url.host, "url.path": request.url.path}
+        ) as span:
+            response = await self.transport.handle_async_request(request)
+            span.set_attribute("http.response.status_code", response.status_code)
+            if response.status_code >= 400:
+                span.set_status(Status(StatusCode.ERROR))
+            return response
+    
+    async def aclose(self):
+        await self.transport.aclose()
+
+async def ensure_product_indexes():
+    """Backfill name_key on legacy products and create its unique index"""
+    if "name_key_1" in await db.products.index_information():
+        return
+    
+    missing = await db.products.find(
+        {"name_key": {"$exists": False}},
+        {"_id": 0, "id": 1, "name": 1}
+    ).to_list(length=None)
+    if missing:
+        try:
+            await db.products.bulk_write(
+                [UpdateOne({"id": product["id"]}, {"$set": {"name_key": normalize_name_key(product.get("name", ""))}})
+                 for product in missing],
+                ordered=False
+            )
+            logger.info(f"Backfilled name_key on {len(missing)} products")
+        except BulkWriteError as e:
+            # Clashing names keep no name_key until resolved (see cleanup_duplicates.py)
+            write_errors = e.details.get("writeErrors", [])
+            for error in write_errors:
+                product = missing[error["index"]]
+                logger.warning(f"Could not backfill name_key on product {product['id']} ({product.get('name')!r}): {error.get('errmsg')}")
+            logger.info(f"Backfilled name_key on {len(missing) - len(write_errors)} of {len(missing)} products")
+    
+    try:
+        await db.products.create_index(
+            [("name_key", ASCENDING)],
+            unique=True,
+            partialFilterExpression={"name_key": {"$type": "string"}}
+        )
+    except OperationFailure as e:
+        # Duplicate names must be resolved first (see cleanup_duplicates.py)
+        logger.warning(f"Could not create unique name_key index: {str(e)}")
+
+async def ensure_auth_indexes():
+    """Refresh tokens are looked up by hash and expire automatically through a TTL index"""
+    await db.refresh_tokens.create_index("token_hash", unique=True)
+    await db.refresh_tokens.create_index("family_id")
+    await db.refresh_tokens.create_index("expires_at", expireAfterSeconds=0)
+    if settings.login_rate_limit_backend == "mongo":
+        await db.rate_limits.create_index("expires_at", expireAfterSeconds=0)
+
+class Readiness:
+    """Background warm-up (ping, index checks) reported by /api/health/ready, retried until MongoDB is up"""
+    
+    def __init__(self, retry_seconds: float = 5.0, max_failures: int = 3):
+        self.retry_seconds = retry_seconds
+        self.max_failures = max_failures
+        self.ready = False
+        self.failed = False
+        self.failures = 0
+        self.attempts = 0
+        self.last_error = None
+        self.warmup_ms = None
+        self._task = None
+    
+    async def warm_up(self):
+        started = time.perf_counter()
+        while True:
+            self.attempts += 1
+            try:
+                await db.command("ping")
+                await ensure_product_indexes()
+                await ensure_auth_indexes()
+                break
+            except ConnectionFailure as e:
+                self.last_error = str(e)
+                logger.warning(f"Warm-up attempt {self.attempts} failed, MongoDB unreachable: {str(e)}")
+            except Exception as e:
+                self.last_error = str(e)
+                self.failures += 1
+                if self.failures >= self.max_failures:
+                    self.failed = True
+                    logger.error(f"Warm-up failed after {self.attempts} attempts, giving up: {str(e)}")
+                    return
+                logger.warning(f"Warm-up attempt {self.attempts} failed: {str(e)}")
+            await asyncio.sleep(self.retry_seconds)
+        self.warmup_ms = round((time.perf_counter() - started) * 1000, 2)
+        self.ready = True
+        logger.info(f"Warm-up finished in {self.warmup_ms}ms")
+    
+    def start(self):
+        self.ready = False
+        self.failed = False
+        self.failures = 0
+        self.attempts = 0
+        self.last_error = None
+        self.warmup_ms = None
+        self._task = asyncio.create_task(self.warm_up())
+    
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "warmup_failed": self.failed,
+            "warmup_attempts": self.attempts,
+            "warmup_ms": self.warmup_ms,
+            "last_error": None if self.ready else self.last_error
+        }
+
+readiness = Readiness()
+
+def configure(app_settings: Settings):
+    """Build this worker's shared state (caches, limiters, monitors) from the app's settings"""
+    global settings, query_profiler, response_encoders, password_hasher, signing_keys, login_ip_limiter, \
+        login_user_limiter, register_limiter, admin_cache, catalog_cache, cache_bus, loop_lag_monitor
+    settings = app_settings
+    configure_logging(app_settings)
+    configure_tracing(app_settings)
+    query_profiler = (QueryProfiler(app_settings.query_profiler_explain_interval_seconds, app_settings.query_profiler_max_shapes)
+                      if app_settings.query_profiler else None)
+    response_encoders = available_encoders(app_settings.response_compression)
+    password_hasher = PasswordHasher(app_settings.password_hash_workers, app_settings.password_hash_max_queue)
+    signing_keys = SigningKeyring.from_settings(app_settings)
+    login_ip_limiter = build_login_limiter("login-ip", app_settings.login_ip_burst, app_settings.login_ip_per_minute)
+    login_user_limiter = build_login_limiter("login-user", app_settings.login_user_burst, app_settings.login_user_per_minute)
+    register_limiter = build_login_limiter("register", app_settings.register_burst, app_settings.register_per_minute)
+    admin_cache = AdminCache(app_settings.admin_cache_ttl_seconds)
+    catalog_cache = CatalogCache(app_settings.catalog_cache_ttl_seconds, app_settings.catalog_cache_max_entries,
+                                 app_settings.catalog_cache_max_bytes, app_settings.catalog_cache_max_entry_bytes)
+    cache_bus = build_cache_bus()
+    loop_lag_monitor = LoopLagMonitor(app_settings.loop_lag_interval_seconds, app_settings.loop_block_debug,
+                                      app_settings.loop_block_threshold_ms / 1000)
+
+def create_app(app_settings: Optional[Settings] = None) -> FastAPI:
+    """Build the API app; MongoDB is only touched once it starts (sample data: `python seed.py`)"""
+    app_settings = app_settings or Settings.from_env()
+    configure(app_settings)
+    
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        logger.info("HANNU CLOTHES CATALOG API starting up...")
+        connect_database(app_settings)
+        if query_profiler is not None:
+            query_profiler.start()
+        readiness.start()
+        await cache_bus.start()
+        loop_lag_monitor.start()
+        yield
+        await loop_lag_monitor.stop()
+        await cache_bus.stop()
+        await readiness.stop()
+        client.close()
+        password_hasher.shutdown()
+    
+    # Create the main app without a prefix
+    app = FastAPI(
+        title="HANNU CLOTHES CATALOG API",
+        description="Professional catalog system for women's clothing",
+        default_response_class=ORJSONResponse,
+        lifespan=lifespan,
+    )
+    
+    # Include the router in the main app
+    app.include_router(api_router)
+    
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        """Prometheus scrape endpoint; served outside /api so the public ingress does not expose it"""
+        return Response(content=generate_latest(metrics_registry), media_type=CONTENT_TYPE_LATEST)
+    
+    app.add_middleware(ProfilingMiddleware)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=app_settings.cors_origins,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.add_middleware(CompressionMiddleware)
+    app.add_middleware(MetricsMiddleware)
+    if app_settings.tracing_exporter != "none":
+        app.add_middleware(TracingMiddleware)
+    app.add_middleware(RequestContextMiddleware)
+    return app
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+app = create_app()
@@ -0,0 +1,148 @@
+"""
+Local fakes of the external services the backend talks to, for offline and
+deterministic performance runs:
+
+    FakeImageHost  image sources behind /api/proxy-image and migrate_images.py
+                   (postimg, imgur, unsplash, ...)
+    FakeImgBB      the ImgBB upload API used by mass_upload_images and migrate_images.py
+
+Both are served through one httpx.MockTransport (see upstream_transport), which is
+what server.upstream_transport and ImageMigrator(transport=...) accept. Latency,
+jitter, error and timeout rates and payload sizes are configurable per fake, and
+all randomness comes from a seeded generator so runs are repeatable.
+"""
+
+import asyncio
+import random
+import uuid
+from typing import Optional
+
+import httpx
+
+class UpstreamProfile:
+    """How a fake behaves: added latency, failure rates and payload size"""
+
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,  # share of requests answered with error_status
+        timeout_rate: float = 0.0,  # share of requests that raise httpx.ReadTimeout after the latency
+        error_status: int = 503,
+        payload_bytes: int = 50_000
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.error_status = error_status
+        self.payload_bytes = payload_bytes
+
+class FakeUpstream:
+    """Shared behaviour: simulated latency and failures, request counters"""
+
+    def __init__(self, profile: Optional[UpstreamProfile] = None, seed: int = 0):
+        self.profile = profile or UpstreamProfile()
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.bytes_sent = 0
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        profile = self.profile
+        delay_ms = profile.latency_ms + (self.rng.uniform(-profile.jitter_ms, profile.jitter_ms) if profile.jitter_ms else 0)
+        if delay_ms > 0:
+            await asyncio.sleep(delay_ms / 1000)
+
+        roll = self.rng.random()
+        if roll < profile.timeout_rate:
+            self.timeouts += 1
+            raise httpx.ReadTimeout("Simulated upstream timeout", request=request)
+        if roll < profile.timeout_rate + profile.error_rate:
+            self.errors += 1
+            return self.error_response(request)
+
+        response = await self.respond(request)
+        self.bytes_sent += len(response.content)
+        return response
+
+    def error_response(self, request: httpx.Request) -> httpx.Response:
+        return httpx.Response(self.profile.error_status, text="Simulated upstream error")
+
+    async def respond(self, request: httpx.Request) -> httpx.Response:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "errors": self.errors, "timeouts": self.timeouts, "bytes_sent": self.bytes_sent}
+
+class FakeImageHost(FakeUpstream):
+    """Serves a JPEG-looking payload of profile.payload_bytes for any path.
+    Paths ending in /missing.jpg return 404, and paths ending in .html return an HTML page."""
+
+    def __init__(self, profile: Optional[UpstreamProfile] = None, seed: int = 0):
+        super().__init__(profile, seed)
+        self._payloads = {}
+
+    def payload(self, size: int) -> bytes:
+        if size not in self._payloads:
+            self._payloads[size] = b"\xff\xd8\xff\xe0" + random.Random(size).randbytes(max(0, size - 6)) + b"\xff\xd9"
+        return self._payloads[size]
+
+    async def respond(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path.endswith("/missing.jpg"):
+            return httpx.Response(404, text="Not found")
+        if path.endswith(".html"):
+            return httpx.Response(200, text="<html><body>Not an image</body></html>", headers={"content-type": "text/html"})
+        return httpx.Response(200, content=self.payload(self.profile.payload_bytes), headers={"content-type": "image/jpeg"})
+
+class FakeImgBB(FakeUpstream):
+    """Accepts POST /1/upload like ImgBB and returns a hosted URL on i.ibb.co.
+    Uploads are recorded in memory (id, name, size) so callers can assert on them."""
+
+    def __init__(self, profile: Optional[UpstreamProfile] = None, seed: int = 0, api_key: Optional[str] = None):
+        super().__init__(profile or UpstreamProfile(error_status=400), seed)
+        self.api_key = api_key
+        self.uploads = []
+
+    def error_response(self, request: httpx.Request) -> httpx.Response:
+        return httpx.Response(self.profile.error_status, json={
+            "status_code": self.profile.error_status,
+            "error": {"message": "Rate limit reached.", "code": 100},
+            "status_txt": "Bad Request"
+        })
+
+    async def respond(self, request: httpx.Request) -> httpx.Response:
+        if request.method != "POST" or request.url.path != "/1/upload":
+            return httpx.Response(404, json={"status_code": 404, "error": {"message": "Not found"}})
+
+        form = httpx.QueryParams((await request.aread()).decode())
+        if self.api_key is not None and form.get("key") != self.api_key:
+            return httpx.Response(400, json={"status_code": 400, "error": {"message": "Invalid API v1 key.", "code": 100}})
+        if not form.get("image"):
+            return httpx.Response(400, json={"status_code": 400, "error": {"message": "Empty upload source.", "code": 130}})
+
+        image_id = uuid.UUID(int=self.rng.getrandbits(128)).hex[:7]
+        name = form.get("name") or image_id
+        size = len(form["image"]) * 3 // 4
+        self.uploads.append({"id": image_id, "name": name, "size": size})
+        url = f"https://i.ibb.co/{image_id}/{name}.jpg"
+        return httpx.Response(200, json={
+            "data": {"id": image_id, "title": name, "url": url, "display_url": url, "size": size},
+            "success": True,
+            "status": 200
+        })
+
+def upstream_transport(image_host: Optional[FakeImageHost] = None, imgbb: Optional[FakeImgBB] = None) -> httpx.MockTransport:
+    """One transport for every outgoing call: api.imgbb.com goes to the ImgBB fake, any other host to the image host"""
+    image_host = image_host or FakeImageHost()
+    imgbb = imgbb or FakeImgBB()
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.host == "api.imgbb.com":
+            return await imgbb.handle(request)
+        return await image_host.handle(request)
+
+    return httpx.MockTransport(handler)
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+HANNU CLOTHES - API load test / benchmark harness
+
+Runs the FastAPI app in-process (httpx ASGI transport, real lifespan) against a
+throwaway database, seeds a synthetic catalog and replays a weighted mix of
+scenarios with concurrent virtual users:
+
+    browse  - product list (all / by category), product detail, categories
+    search  - catalog search
+    proxy   - image proxy, served by the fake image host (fake_upstreams.py)
+    admin   - product and stock edits
+    upload  - mass image upload, served by the fake ImgBB (fake_upstreams.py)
+
+Reports p50/p95/p99 latency and throughput per scenario and compares the run to a
+stored baseline; a regression beyond the tolerance makes the script exit with 1.
+Client and app share one event loop (and the client decompresses what the app
+compresses), so numbers are for comparing runs on the same machine, not absolute
+capacity. "avg KB" is the transferred (compressed) size per response.
+
+Usage:
+    python benchmarks/load_test.py                       # mongomock-motor stand-in
+    python benchmarks/load_test.py --mongo mongodb://localhost:27017
+    python benchmarks/load_test.py --save-baseline       # record benchmarks/baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+
+from fake_upstreams import FakeImageHost, FakeImgBB, UpstreamProfile, upstream_transport
+
+BENCHMARK_DIR = Path(__file__).parent
+sys.path.insert(0, str(BENCHMARK_DIR.parent / "backend"))
+
+DEFAULT_MIX = "browse=60,search=15,proxy=15,admin=8,upload=2"
+CATEGORIES = ["vestidos", "enterizos", "conjuntos", "blusas", "faldas", "pantalones"]
+WORDS = ["Rosa", "Elegante", "Lino", "Floral", "Negro", "Clásico", "Verano", "Seda", "Boho", "Midi", "Satín", "Encaje"]
+SIZES = ["XS", "S", "M", "L", "XL"]
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = float(weight)
+    return weights
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def synthetic_product(rng: random.Random, index: int) -> dict:
+    retail_price = rng.randrange(60, 300) * 1000
+    name = f"{' '.join(rng.sample(WORDS, 2))} {index}"
+    return {
+        "id": str(uuid.uuid4()),
+        "name": name,
+        "description": f"Prenda {name.lower()} para el catálogo de pruebas de rendimiento",
+        "retail_price": retail_price,
+        "wholesale_price": int(retail_price * 0.7),
+        "category": rng.choice(CATEGORIES),
+        "images": [f"https://i.imgur.com/bench/{index % 50}.jpg"],
+        "colors": rng.sample(["rojo", "negro", "azul", "blanco", "verde"], 2),
+        "sizes": SIZES,
+        "stock": {size: rng.randrange(0, 20) for size in SIZES},
+        "created_at": datetime(2024, 1, 1) + timedelta(minutes=index),
+        "updated_at": datetime(2024, 1, 1) + timedelta(minutes=index),
+    }
+
+class LoadTester:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.weights = parse_mix(args.mix)
+        self.latencies = {name: [] for name in self.weights}
+        self.errors = {name: 0 for name in self.weights}
+        self.transferred = {name: 0 for name in self.weights}
+        self.products = []
+        self.token = None
+        self.issued = 0
+
+    # Scenarios: each returns the response of the single request it makes
+    async def browse(self, client: httpx.AsyncClient, rng: random.Random):
+        choice = rng.random()
+        if choice < 0.45:
+            return await client.get("/api/products", params={"limit": 100})
+        if choice < 0.75:
+            return await client.get("/api/products", params={"category": rng.choice(CATEGORIES)})
+        if choice < 0.95:
+            return await client.get(f"/api/products/{rng.choice(self.products)['id']}")
+        return await client.get("/api/categories")
+
+    async def search(self, client: httpx.AsyncClient, rng: random.Random):
+        return await client.get("/api/catalog/search", params={"query": rng.choice(WORDS).lower()})
+
+    async def proxy(self, client: httpx.AsyncClient, rng: random.Random):
+        return await client.get("/api/proxy-image", params={"url": f"https://i.imgur.com/bench/{rng.randrange(50)}.jpg"})
+
+    async def admin(self, client: httpx.AsyncClient, rng: random.Random):
+        product = rng.choice(self.products)
+        headers = {"Authorization": f"Bearer {self.token}"}
+        if rng.random() < 0.5:
+            return await client.put(f"/api/products/{product['id']}", json={"description": f"Editado {rng.randrange(10**6)}"}, headers=headers)
+        size = rng.choice(SIZES)
+        return await client.put(f"/api/products/{product['id']}/stock/{size}", json={"size": size, "quantity": rng.randrange(20)}, headers=headers)
+
+    async def upload(self, client: httpx.AsyncClient, rng: random.Random):
+        batch = rng.sample(self.products, 3)
+        files = [("files", (f"{index}.jpg", b"\xff\xd8\xff\xe0" + b"\x00" * 2048, "image/jpeg")) for index in range(len(batch))]
+        return await client.post(
+            "/api/admin/upload-images",
+            data={"product_names": ",".join(product["name"] for product in batch)},
+            files=files,
+            headers={"Authorization": f"Bearer {self.token}"}
+        )
+
+    async def seed(self, db):
+        await db.products.delete_many({})
+        documents = []
+        for index in range(self.args.products):
+            product = server.Product(**synthetic_product(self.rng, index))
+            documents.append(server.product_to_document(product))
+        await db.products.insert_many(documents)
+        self.products = [{"id": doc["id"], "name": doc["name"]} for doc in documents]
+        await seed.DatabaseSeeder(db).seed_admin()
+
+    async def virtual_user(self, client: httpx.AsyncClient, user_index: int):
+        rng = random.Random(self.args.seed * 1000 + user_index)
+        names = list(self.weights)
+        weights = [self.weights[name] for name in names]
+        while self.issued < self.args.requests:
+            self.issued += 1
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                response = await getattr(self, name)(client, rng)
+                ok = response.status_code < 400
+                self.transferred[name] += response.num_bytes_downloaded
+            except httpx.HTTPError:
+                ok = False
+            self.latencies[name].append(time.perf_counter() - started)
+            if not ok:
+                self.errors[name] += 1
+
+    async def run(self) -> dict:
+        app = server.create_app(server.Settings(
+            mongo_url=self.args.mongo,
+            db_name=self.args.db_name,
+            public_read_preference="primary",  # benchmark databases are standalone
+            cache_invalidation_bus="local",
+            imgbb_api_key="benchmark"
+        ))
+        profile = dict(latency_ms=self.args.upstream_latency_ms, jitter_ms=self.args.upstream_latency_ms / 2,
+                       error_rate=self.args.upstream_error_rate)
+        self.image_host = FakeImageHost(UpstreamProfile(payload_bytes=self.args.image_bytes, **profile), seed=self.args.seed)
+        self.imgbb = FakeImgBB(UpstreamProfile(error_status=400, **profile), seed=self.args.seed)
+        server.upstream_transport = upstream_transport(self.image_host, self.imgbb)
+
+        async with app.router.lifespan_context(app):
+            while not server.readiness.ready:
+                await asyncio.sleep(0.05)
+            print(f"🌱 Seeding {self.args.products} products into {self.args.db_name}...")
+            await self.seed(server.db)
+
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=60,
+                                         headers={"Accept-Encoding": self.args.accept_encoding}) as client:
+                response = await client.post("/api/admin/login", json={"username": "admin", "password": "admin123"})
+                self.token = response.json()["access_token"]
+
+                print(f"🚀 {self.args.requests} requests, {self.args.users} users, mix {self.args.mix}")
+                started = time.perf_counter()
+                await asyncio.gather(*[self.virtual_user(client, index) for index in range(self.args.users)])
+                elapsed = time.perf_counter() - started
+
+            await server.db.products.delete_many({})
+            await server.db.admins.delete_many({})
+        server.upstream_transport = None
+        return self.summarize(elapsed)
+
+    def summarize(self, elapsed: float) -> dict:
+        results = {"elapsed_seconds": round(elapsed, 3), "scenarios": {},
+                   "upstreams": {"image_host": self.image_host.stats(), "imgbb": self.imgbb.stats()}}
+        all_latencies = []
+        for name, latencies in self.latencies.items():
+            if not latencies:
+                continue
+            latencies.sort()
+            all_latencies.extend(latencies)
+            results["scenarios"][name] = {
+                "requests": len(latencies),
+                "errors": self.errors[name],
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+                "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+                "rps": round(len(latencies) / elapsed, 1),
+                "avg_kb": round(self.transferred[name] / len(latencies) / 1024, 1),
+            }
+        all_latencies.sort()
+        results["total"] = {
+            "requests": len(all_latencies),
+            "errors": sum(self.errors.values()),
+            "p50_ms": round(percentile(all_latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(all_latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(all_latencies, 0.99) * 1000, 2),
+            "rps": round(len(all_latencies) / elapsed, 1),
+            "avg_kb": round(sum(self.transferred.values()) / len(all_latencies) / 1024, 1),
+        }
+        return results
+
+def print_results(results: dict):
+    print("\n" + "=" * 88)
+    print(f"{'scenario':<10}{'requests':>10}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rps':>10}{'avg KB':>10}")
+    print("-" * 88)
+    rows = list(results["scenarios"].items()) + [("TOTAL", results["total"])]
+    for name, row in rows:
+        print(f"{name:<10}{row['requests']:>10}{row['errors']:>8}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row['rps']:>10}{row.get('avg_kb', '-'):>10}")
+    print("=" * 88)
+    for name, stats in results.get("upstreams", {}).items():
+        print(f"🌐 {name}: {stats['requests']} requests, {stats['errors']} errors, {stats['timeouts']} timeouts")
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float) -> list:
+    """Regressions: p95 slower or throughput lower than the baseline by more than the tolerance, or new errors"""
+    regressions = []
+    rows = dict(results["scenarios"], TOTAL=results["total"])
+    baseline_rows = dict(baseline["scenarios"], TOTAL=baseline["total"])
+    for name, base in baseline_rows.items():
+        current = rows.get(name)
+        if current is None:
+            continue
+        if current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95_ms']}ms vs baseline {base['p95_ms']}ms")
+        if current["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {current['rps']} rps vs baseline {base['rps']} rps")
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{name}: {current['errors']} errors vs baseline {base['errors']}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the catalog API in-process")
+    parser.add_argument("--mongo", default="mock", help="'mock' for mongomock-motor or a MongoDB URL")
+    parser.add_argument("--db-name", default="hannu_benchmark", help="Throwaway database; its products and admins are deleted")
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--image-bytes", type=int, default=50_000)
+    parser.add_argument("--upstream-latency-ms", type=float, default=0.0, help="Latency of the fake image host and ImgBB (±50%% jitter)")
+    parser.add_argument("--upstream-error-rate", type=float, default=0.0, help="Share of fake upstream calls that fail")
+    parser.add_argument("--accept-encoding", default="gzip, deflate, br, zstd", help="Sent with every request, like a browser")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", default=str(BENCHMARK_DIR / "baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown before failing")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    if "benchmark" not in args.db_name:
+        parser.error("--db-name must contain 'benchmark': the run deletes its products and admins")
+
+    # Read by the module-level app the server builds at import time (it also sets up logging)
+    os.environ.setdefault("MONGO_URL", args.mongo)
+    os.environ.setdefault("DB_NAME", args.db_name)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    global server, seed
+    import server
+    import seed
+
+    if args.mongo == "mock":
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            parser.error("--mongo mock needs mongomock-motor (pip install mongomock-motor), or pass a MongoDB URL")
+        mock_client = AsyncMongoMockClient()
+        server.AsyncIOMotorClient = lambda *client_args, **client_kwargs: mock_client
+
+    print("HANNU CLOTHES - API Load Test")
+    print()
+
+    results = asyncio.run(LoadTester(args).run())
+    results.update(recorded_at=datetime.utcnow().isoformat(), mongo="mock" if args.mongo == "mock" else "mongodb",
+                   products=args.products, users=args.users, mix=args.mix)
+    print_results(results)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"💾 Baseline saved to {baseline_path}")
+        return
+
+    if not baseline_path.exists():
+        print("ℹ️ No baseline found; run with --save-baseline to record one")
+        return
+
+    regressions = compare_to_baseline(results, json.loads(baseline_path.read_text()), args.tolerance)
+    if regressions:
+        print(f"❌ PERFORMANCE REGRESSIONS (tolerance {args.tolerance:.0%}):")
+        for regression in regressions:
+            print(f"   - {regression}")
+        sys.exit(1)
+    print(f"✅ Within {args.tolerance:.0%} of the baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+HANNU CLOTHES - Micro-benchmarks for the product read path
+
+Times each step that turns stored product documents into the /api/products
+response, over synthetic catalogs of 100 / 1k / 10k products in the legacy shapes
+the maintenance scripts wrote (colors/sizes as text, images [""], specifications
+as a dict, care_instructions, is_active) and in the migrated shape:
+
+    normalize        clean_product_fields() on legacy documents
+    from_dict        Product.from_dict() on legacy documents
+    validate         List[Product] validation, what response_model=List[Product] does
+    encode_default   response_model dump + JSONResponse (FastAPI's previous default)
+    encode_orjson    response_model dump + ORJSONResponse (the app's default response class)
+    response_legacy  products_response() on legacy documents
+    response_fast    products_response() on migrated documents (current schema_version)
+
+Each step reports min/mean/stddev over several rounds, like pytest-benchmark, plus
+the allocated and peak memory measured with tracemalloc in a separate pass (tracing
+slows the code down, so it never runs while timing).
+
+Usage: python benchmarks/micro_bench.py [--sizes 100,1000,10000] [--rounds 5] [--output results.json]
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "hannu_benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import TypeAdapter
+
+import server
+from migrations import migrate_document
+from normalization import clean_product_fields
+
+CATEGORIES = ["vestidos", "enterizos", "conjuntos", "blusas", "faldas", "pantalones"]
+
+def legacy_product(rng: random.Random, index: int) -> dict:
+    """A product as restore_products.py and the early admin panel stored it"""
+    product = {
+        "id": str(uuid.uuid4()),
+        "name": f"Producto {index}",
+        "description": "Prenda de prueba con descripción de longitud realista para el catálogo " * 2,
+        "retail_price": rng.randrange(60, 300) * 1000,
+        "wholesale_price": rng.randrange(40, 60) * 1000,
+        "category": rng.choice(CATEGORIES),
+        "images": [""] if index % 3 else [f"https://i.postimg.cc/{index}/foto.jpg"],
+        "colors": "rojo, negro, azul" if index % 2 else "",
+        "sizes": "S, M, L" if index % 2 else "",
+        "composition": "",
+        "created_at": datetime(2024, 1, 1) + timedelta(minutes=index),
+        "is_active": True,
+    }
+    if index % 4 == 0:
+        product["specifications"] = {"largo": "midi"}
+        product["care_instructions"] = "Lavar a mano"
+    if index % 5 == 0:
+        product["stock"] = {"S": rng.randrange(10), "M": rng.randrange(10), "L": rng.randrange(10)}
+    return product
+
+def build_catalogs(size: int) -> dict:
+    rng = random.Random(size)
+    legacy = [legacy_product(rng, index) for index in range(size)]
+    return {"legacy": legacy, "migrated": [migrate_document(product) for product in legacy]}
+
+def bench_steps(catalogs: dict) -> dict:
+    """step name -> zero-argument callable; inputs are prepared outside the timed call"""
+    list_adapter = TypeAdapter(List[server.Product])
+    cleaned = [clean_product_fields(product) for product in catalogs["legacy"]]
+    validated = list_adapter.validate_python(cleaned)
+    return {
+        "normalize": lambda: [clean_product_fields(product) for product in catalogs["legacy"]],
+        "from_dict": lambda: [server.Product.from_dict(product) for product in catalogs["legacy"]],
+        "validate": lambda: list_adapter.validate_python(cleaned),
+        "encode_default": lambda: JSONResponse(list_adapter.dump_python(validated, mode="json")).body,
+        "encode_orjson": lambda: ORJSONResponse(list_adapter.dump_python(validated, mode="json")).body,
+        "response_legacy": lambda: server.products_response(catalogs["legacy"]).body,
+        "response_fast": lambda: server.products_response(catalogs["migrated"]).body,
+    }
+
+def time_call(func, rounds: int) -> dict:
+    func()  # warm-up: adapters, caches
+    timings = []
+    for _ in range(rounds):
+        gc.collect()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return {
+        "min_ms": round(min(timings) * 1000, 3),
+        "mean_ms": round(statistics.mean(timings) * 1000, 3),
+        "stddev_ms": round(statistics.stdev(timings) * 1000, 3) if len(timings) > 1 else 0.0,
+    }
+
+def trace_allocations(func) -> dict:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        result = func()
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return {"retained_kb": round((after - before) / 1024, 1), "peak_kb": round((peak - before) / 1024, 1)}
+
+class MicroBenchmark:
+    def __init__(self, sizes: List[int], rounds: int, steps: List[str]):
+        self.sizes = sizes
+        self.rounds = rounds
+        self.steps = steps
+        self.results = {}
+
+    def run(self):
+        for size in self.sizes:
+            catalogs = build_catalogs(size)
+            steps = bench_steps(catalogs)
+            self.results[size] = {}
+            for name in self.steps:
+                row = time_call(steps[name], self.rounds)
+                row.update(trace_allocations(steps[name]))
+                row["us_per_product"] = round(row["min_ms"] * 1000 / size, 2)
+                self.results[size][name] = row
+            self.print_size(size)
+        return self.results
+
+    def print_size(self, size: int):
+        print(f"\n📦 {size} products")
+        print(f"{'step':<17}{'min ms':>10}{'mean ms':>10}{'stddev':>9}{'µs/prod':>10}{'peak KB':>11}{'kept KB':>10}")
+        print("-" * 77)
+        for name, row in self.results[size].items():
+            print(f"{name:<17}{row['min_ms']:>10}{row['mean_ms']:>10}{row['stddev_ms']:>9}"
+                  f"{row['us_per_product']:>10}{row['peak_kb']:>11}{row['retained_kb']:>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for product normalization, validation and encoding")
+    parser.add_argument("--sizes", default="100,1000,10000")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--steps", help="Comma-separated subset of steps to run")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    all_steps = list(bench_steps({"legacy": [], "migrated": []}))
+    steps = args.steps.split(",") if args.steps else all_steps
+    unknown = set(steps) - set(all_steps)
+    if unknown:
+        parser.error(f"Unknown steps: {', '.join(sorted(unknown))} (available: {', '.join(all_steps)})")
+
+    print("HANNU CLOTHES - Catalog Micro-benchmarks")
+    results = MicroBenchmark([int(size) for size in args.sizes.split(",")], args.rounds, steps).run()
+
+    if args.output:
+        Path(args.output).write_text(json.dumps({str(size): rows for size, rows in results.items()}, indent=2))
+        print(f"\n💾 Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,33 @@ import { ShoppingCart, User, Search, Menu, X, Heart, Star, ArrowRight, Check, Ph
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+// Renew expired admin sessions with the refresh token instead of logging in again.
+// Concurrent 401s share one refresh call: refresh tokens are single-use.
+let refreshPromise = null;
+axios.interceptors.response.use(undefined, async (error) => {
+  const original = error.config;
+  const refreshToken = localStorage.getItem('adminRefreshToken');
+  if (error.response?.status !== 401 || !refreshToken || !original || original._retried || original.url?.includes('/admin/refresh')) {
+    return Promise.reject(error);
+  }
+  original._retried = true;
+  try {
+    if (!refreshPromise) {
+      refreshPromise = axios.post(`${API}/admin/refresh`, { refresh_token: refreshToken })
+        .finally(() => { refreshPromise = null; });
+    }
+    const { data } = await refreshPromise;
+    localStorage.setItem('adminToken', data.access_token);
+    localStorage.setItem('adminRefreshToken', data.refresh_token);
+    original.headers.Authorization = `Bearer ${data.access_token}`;
+    return axios(original);
+  } catch (refreshError) {
+    localStorage.removeItem('adminToken');
+    localStorage.removeItem('adminRefreshToken');
+    return Promise.reject(error);
+  }
+});
+
 // SmartImage component with improved fallback handling
 const SmartImage = ({ originalSrc, alt, alternativeUrl, productName }) => {
   const [imageError, setImageError] = useState(false);
@@ -724,6 +751,7 @@ const AdminPanel = ({ isOpen, onClose, products, setProducts, productToEdit }) =
     localStorage.removeItem('managerAuthenticated');
     localStorage.removeItem('managerUsername');
     localStorage.removeItem('adminToken');
+    localStorage.removeItem('adminRefreshToken');
     onClose();
   };
 
@@ -845,6 +873,7 @@ const AdminPanel = ({ isOpen, onClose, products, setProducts, productToEdit }) =
       
       const token = response.data.access_token;
       localStorage.setItem('adminToken', token);
+      localStorage.setItem('adminRefreshToken', response.data.refresh_token);
       console.log('✅ Admin logged in successfully');
       return token;
     } catch (error) {
@@ -1477,6 +1506,7 @@ const Home = () => {
       
       const token = response.data.access_token;
       localStorage.setItem('adminToken', token);
+      localStorage.setItem('adminRefreshToken', response.data.refresh_token);
       alert('✅ Sesión de administrador iniciada correctamente');
       return token;
     } catch (error) {
@@ -0,0 +1,78 @@
+"""
+Shared fixtures: the API app running against an in-memory mongomock-motor database,
+with the default admin seeded and the login limiters out of the way.
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Read by the module-level app the server builds at import time (it also sets up logging)
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "hannu_test")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+import seed
+import server
+
+PRODUCT = {
+    "name": "Vestido Prueba",
+    "description": "Vestido de prueba",
+    "retail_price": 100000,
+    "wholesale_price": 70000,
+    "category": "vestidos",
+    "images": ["https://i.ibb.co/abc/vestido.jpg"],
+    "sizes": ["S", "M"],
+    "stock": {"S": 5, "M": 3},
+}
+
+@pytest.fixture
+def client(monkeypatch):
+    mock_client = AsyncMongoMockClient()
+    monkeypatch.setattr(server, "AsyncIOMotorClient", lambda *args, **kwargs: mock_client)
+    app = server.create_app(server.Settings(
+        mongo_url="mongodb://localhost:27017",
+        db_name="hannu_test",
+        public_read_preference="primary",
+        cache_invalidation_bus="local",
+        login_ip_burst=1000,
+        login_user_burst=1000
+    ))
+    with TestClient(app) as test_client:
+        while not server.readiness.ready:  # indexes are created by the background warm-up
+            time.sleep(0.01)
+        test_client.portal.call(seed.DatabaseSeeder(server.db).run, True)
+        yield test_client
+
+@pytest.fixture
+def login(client):
+    response = client.post("/api/admin/login", json={"username": "admin", "password": "admin123"})
+    assert response.status_code == 200
+    return response.json()
+
+@pytest.fixture
+def auth(login):
+    return {"Authorization": f"Bearer {login['access_token']}"}
+
+@pytest.fixture
+def make_product(client, auth):
+    def make(**overrides):
+        response = client.post("/api/products", json={**PRODUCT, **overrides}, headers=auth)
+        assert response.status_code == 200, response.text
+        return response.json()
+    return make
+
+@pytest.fixture
+def stored(client):
+    def find(product_id):
+        return client.portal.call(server.db.products.find_one, {"id": product_id}, {"_id": 0})
+    return find
@@ -0,0 +1,62 @@
+import server
+
+def bearer(tokens):
+    return {"Authorization": f"Bearer {tokens['access_token']}"}
+
+def test_login_issues_access_and_refresh_tokens(client, login):
+    assert login["token_type"] == "bearer"
+    assert login["refresh_token"] and login["expires_in"] > 0
+    response = client.get("/api/admin/me", headers=bearer(login))
+    assert response.status_code == 200
+    assert response.json()["username"] == "admin"
+
+def test_refresh_rotates_the_refresh_token(client, login):
+    response = client.post("/api/admin/refresh", json={"refresh_token": login["refresh_token"]})
+    assert response.status_code == 200
+    rotated = response.json()
+    assert rotated["refresh_token"] != login["refresh_token"]
+    assert client.get("/api/admin/me", headers=bearer(rotated)).status_code == 200
+    assert client.post("/api/admin/refresh", json={"refresh_token": rotated["refresh_token"]}).status_code == 200
+
+def test_reusing_a_rotated_refresh_token_ends_the_session(client, login):
+    rotated = client.post("/api/admin/refresh", json={"refresh_token": login["refresh_token"]}).json()
+    assert client.post("/api/admin/refresh", json={"refresh_token": login["refresh_token"]}).status_code == 401
+    # The token issued by the legitimate rotation belongs to the same family and is revoked too
+    assert client.post("/api/admin/refresh", json={"refresh_token": rotated["refresh_token"]}).status_code == 401
+
+def test_logout_revokes_the_refresh_token(client, login):
+    assert client.post("/api/admin/logout", json={"refresh_token": login["refresh_token"]}).status_code == 200
+    assert client.post("/api/admin/refresh", json={"refresh_token": login["refresh_token"]}).status_code == 401
+
+def test_unknown_refresh_token_is_rejected(client):
+    assert client.post("/api/admin/refresh", json={"refresh_token": "not-a-token"}).status_code == 401
+
+def test_change_password_revokes_every_token(client, login):
+    response = client.post("/api/admin/change-password", headers=bearer(login),
+                           json={"current_password": "admin123", "new_password": "nueva-clave-1"})
+    assert response.status_code == 200
+    assert client.get("/api/admin/me", headers=bearer(login)).json()["detail"] == "Token has been revoked"
+    assert client.post("/api/admin/refresh", json={"refresh_token": login["refresh_token"]}).status_code == 401
+    assert client.post("/api/admin/login", json={"username": "admin", "password": "admin123"}).status_code == 401
+    relogin = client.post("/api/admin/login", json={"username": "admin", "password": "nueva-clave-1"}).json()
+    assert client.get("/api/admin/me", headers=bearer(relogin)).status_code == 200
+
+def test_change_password_checks_the_current_password(client, login):
+    response = client.post("/api/admin/change-password", headers=bearer(login),
+                           json={"current_password": "incorrecta", "new_password": "nueva-clave-1"})
+    assert response.status_code == 400
+    assert client.get("/api/admin/me", headers=bearer(login)).status_code == 200
+
+def test_tampered_access_token_is_rejected(client, login):
+    token = login["access_token"]
+    tampered = token[:-2] + ("AA" if not token.endswith("AA") else "BB")
+    assert client.get("/api/admin/me", headers={"Authorization": f"Bearer {tampered}"}).status_code == 401
+
+def test_tokens_without_embedded_claims_are_revoked_too(client, login):
+    legacy = server.create_access_token({"sub": "admin"})
+    assert client.get("/api/admin/me", headers={"Authorization": f"Bearer {legacy}"}).status_code == 200
+    client.post("/api/admin/change-password", headers=bearer(login),
+                json={"current_password": "admin123", "new_password": "nueva-clave-1"})
+    response = client.get("/api/admin/me", headers={"Authorization": f"Bearer {legacy}"})
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Token has been revoked"
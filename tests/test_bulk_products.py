@@ -0,0 +1,77 @@
+import server
+from pymongo import UpdateOne
+
+NEW_PRODUCT = {"name": "Falda Nueva", "description": "", "retail_price": 80000, "wholesale_price": 50000, "category": "faldas"}
+
+def bulk(client, auth, *operations):
+    response = client.post("/api/products/bulk", json={"operations": list(operations)}, headers=auth)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_bulk_applies_mixed_operations(client, auth, make_product, stored):
+    updated = make_product()
+    deleted = make_product(name="Blusa Borrar", category="blusas")
+    result = bulk(client, auth,
+        {"action": "create", "product": NEW_PRODUCT},
+        {"action": "update", "id": updated["id"], "changes": {"description": "Nueva descripción"}},
+        {"action": "delete", "id": deleted["id"]},
+    )
+    assert (result["created"], result["updated"], result["deleted"], result["failed"]) == (1, 1, 1, 0)
+    assert stored(updated["id"])["description"] == "Nueva descripción"
+    assert stored(deleted["id"]) is None
+
+def test_bulk_reports_per_item_errors(client, auth, make_product):
+    product = make_product()
+    result = bulk(client, auth,
+        {"action": "create", "product": {**NEW_PRODUCT, "name": product["name"].upper()}},
+        {"action": "create", "product": {**NEW_PRODUCT, "wholesale_price": 90000}},
+        {"action": "update", "id": "missing", "changes": {"description": "x"}},
+    )
+    assert result["failed"] == 3
+    assert [item["status_code"] for item in result["results"]] == [400, 400, 404]
+
+def test_bulk_rejects_a_second_operation_on_the_same_product(client, auth, make_product, stored):
+    product = make_product()
+    result = bulk(client, auth,
+        {"action": "update", "id": product["id"], "changes": {"retail_price": 120000}},
+        {"action": "update", "id": product["id"], "changes": {"wholesale_price": 130000}},
+    )
+    assert [item["status"] for item in result["results"]] == ["success", "error"]
+    assert result["results"][1]["status_code"] == 409
+    document = stored(product["id"])
+    assert document["wholesale_price"] < document["retail_price"]
+
+def test_bulk_update_price_guard_catches_concurrent_edits(client, auth, make_product, stored, monkeypatch):
+    product = make_product()
+    collection_type = type(server.db.products)
+    bulk_write = collection_type.bulk_write
+    async def racing_bulk_write(self, requests, **kwargs):
+        # Another admin lowers the retail price after the batch loaded its snapshot
+        await bulk_write(self, [UpdateOne({"id": product["id"]}, {"$set": {"retail_price": 60000}})])
+        return await bulk_write(self, requests, **kwargs)
+    monkeypatch.setattr(collection_type, "bulk_write", racing_bulk_write)
+    result = bulk(client, auth, {"action": "update", "id": product["id"], "changes": {"wholesale_price": 65000}})
+    assert result["results"][0]["status_code"] == 409
+    assert stored(product["id"])["wholesale_price"] == 70000
+
+def test_bulk_upsert_by_name_keeps_fields_not_sent(client, auth, make_product, stored):
+    product = make_product()
+    result = bulk(client, auth, {"action": "upsert", "product": {
+        "name": "vestido prueba", "description": "Actualizado", "retail_price": 110000, "wholesale_price": 70000, "category": "vestidos"
+    }})
+    assert result["results"][0]["message"] == "updated"
+    assert result["results"][0]["id"] == product["id"]
+    document = stored(product["id"])
+    assert document["description"] == "Actualizado"
+    assert document["retail_price"] == 110000
+    assert document["stock"] == {"S": 5, "M": 3}
+    assert document["images"] == product["images"]
+    assert document["created_at"] is not None
+
+def test_bulk_upsert_inserts_the_full_product(client, auth, stored):
+    result = bulk(client, auth, {"action": "upsert", "product": {**NEW_PRODUCT, "stock": {"S": 2}}})
+    assert result["created"] == 1
+    document = stored(result["results"][0]["id"])
+    assert document["name_key"] == "falda nueva"
+    assert document["stock"] == {"S": 2}
+    assert document["schema_version"] == server.PRODUCT_SCHEMA_VERSION
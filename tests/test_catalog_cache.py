@@ -0,0 +1,25 @@
+import server
+
+def test_cache_is_bounded_by_total_bytes():
+    cache = server.CatalogCache(60, max_entries=100, max_bytes=1000, max_entry_bytes=600)
+    for number in range(5):
+        cache.set(("list", number), number, 300)
+    assert cache.stats()["bytes"] == 900
+    assert cache.get(("list", 0)) is None and cache.get(("list", 4)) == 4
+    cache.set(("list", 4), "again", 100)
+    assert cache.stats()["bytes"] == 700
+
+def test_oversized_entries_are_not_cached():
+    cache = server.CatalogCache(60, max_bytes=1000, max_entry_bytes=600)
+    cache.set(("export",), "big", 601)
+    assert cache.get(("export",)) is None
+    assert cache.stats()["oversized"] == 1 and cache.stats()["bytes"] == 0
+
+def test_invalidation_releases_the_bytes():
+    cache = server.CatalogCache(60)
+    cache.set(("product", "a"), "a", 100)
+    cache.set(("list", None), "list", 200)
+    cache.evict_product("b")
+    assert cache.stats()["bytes"] == 100
+    cache.evict_product()
+    assert cache.stats()["bytes"] == 0
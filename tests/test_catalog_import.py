@@ -0,0 +1,87 @@
+import io
+
+import server
+from openpyxl import Workbook
+from pymongo import UpdateOne
+
+HEADER = "name,description,retail_price,wholesale_price,category,colors,stock\n"
+
+def import_csv(client, auth, body, dry_run=False):
+    response = client.post("/api/catalog/import", params={"dry_run": dry_run},
+                           files={"file": ("catalogo.csv", (HEADER + body).encode(), "text/csv")}, headers=auth)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_import_creates_updates_and_skips_unchanged(client, auth, make_product, stored):
+    changed = make_product()
+    unchanged = make_product(name="Blusa Igual", category="blusas")
+    unchanged_at = stored(unchanged["id"])["updated_at"]
+    result = import_csv(client, auth,
+        "Vestido Prueba,Vestido de prueba,120000,70000,vestidos,,\n"
+        "Blusa Igual,Vestido de prueba,100000,70000,blusas,,\n"
+        "Falda Nueva,Falda,50000,30000,faldas,\"rojo, azul\",\"S:3, M:2\"\n"
+    )
+    assert (result["created"], result["updated"], result["unchanged"], result["failed"]) == (1, 1, 1, 0)
+    assert stored(changed["id"])["retail_price"] == 120000
+    assert stored(changed["id"])["stock"] == {"S": 5, "M": 3}
+    assert stored(unchanged["id"])["updated_at"] == unchanged_at
+    created = client.portal.call(server.db.products.find_one, {"name_key": "falda nueva"})
+    assert created["colors"] == ["rojo", "azul"]
+    assert created["stock"] == {"S": 3, "M": 2}
+
+def test_import_reports_invalid_rows_and_keeps_the_rest(client, auth):
+    result = import_csv(client, auth,
+        "Falda Uno,,50000,30000,faldas,,\n"
+        "falda uno,,50000,30000,faldas,,\n"
+        "Precio Malo,,abc,30000,faldas,,\n"
+        "Mayorista Alto,,50000,60000,faldas,,\n"
+        "Categoria Mala,,50000,30000,zapatos,,\n"
+        "Stock Malo,,50000,30000,faldas,,S3\n"
+    )
+    assert result["created"] == 1
+    assert {error["row"]: error["message"] for error in result["errors"]} == {
+        3: "Product appears more than once in the file",
+        4: "Invalid retail_price 'abc'",
+        5: "Wholesale price must be less than retail price",
+        6: "Invalid category",
+        7: "Invalid stock entry 'S3', expected SIZE:QUANTITY",
+    }
+
+def test_import_dry_run_writes_nothing(client, auth):
+    result = import_csv(client, auth, "Falda Uno,,50000,30000,faldas,,\n", dry_run=True)
+    assert result["created"] == 1 and result["dry_run"]
+    assert client.portal.call(server.db.products.count_documents, {}) == 0
+
+def test_import_reads_xlsx(client, auth):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["name", "retail_price", "wholesale_price", "category", "sizes"])
+    sheet.append(["Top Uno", 40000.0, 25000, "blusas", "S, M"])
+    data = io.BytesIO()
+    workbook.save(data)
+    response = client.post("/api/catalog/import", files={"file": ("catalogo.xlsx", data.getvalue())}, headers=auth)
+    assert response.json()["created"] == 1
+    created = client.portal.call(server.db.products.find_one, {"name_key": "top uno"})
+    assert created["retail_price"] == 40000 and created["sizes"] == ["S", "M"]
+
+def test_import_reports_legacy_string_prices_as_row_errors(client, auth):
+    client.portal.call(server.db.products.insert_one, {
+        "id": "legacy", "name": "Legado", "name_key": "legado", "description": "",
+        "retail_price": "100000", "wholesale_price": "50000", "category": "blusas"
+    })
+    result = import_csv(client, auth, "Legado,,120000,,blusas,,\nFalda Uno,,50000,30000,faldas,,\n")
+    assert result["created"] == 1
+    assert result["errors"] == [{"row": 2, "name": "Legado", "message": "Stored product has invalid prices, fix it before importing"}]
+
+def test_import_update_price_guard_catches_concurrent_edits(client, auth, make_product, stored, monkeypatch):
+    product = make_product()
+    collection_type = type(server.db.products)
+    bulk_write = collection_type.bulk_write
+    async def racing_bulk_write(self, requests, **kwargs):
+        await bulk_write(self, [UpdateOne({"id": product["id"]}, {"$set": {"retail_price": 60000}})])
+        return await bulk_write(self, requests, **kwargs)
+    monkeypatch.setattr(collection_type, "bulk_write", racing_bulk_write)
+    result = import_csv(client, auth, "Vestido Prueba,,,65000,,,\n")
+    assert result["updated"] == 0
+    assert result["errors"][0]["message"] == "Wholesale price must be less than retail price"
+    assert stored(product["id"])["wholesale_price"] == 70000
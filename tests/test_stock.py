@@ -0,0 +1,88 @@
+import server
+from pymongo.errors import AutoReconnect
+
+# mongomock re-applies the filter to find the ReturnDocument.AFTER document, so these tests
+# leave at least the reserved quantity in stock; real MongoDB has no such restriction
+
+def test_reserve_decrements_stock(client, auth, make_product, stored):
+    product = make_product()
+    response = client.post(f"/api/products/{product['id']}/stock/reserve", json={"size": "S", "quantity": 2}, headers=auth)
+    assert response.status_code == 200
+    assert response.json()["remaining"] == 3
+    assert stored(product["id"])["stock"]["S"] == 3
+
+def test_reserve_never_goes_below_zero(client, auth, make_product, stored):
+    product = make_product()
+    response = client.post(f"/api/products/{product['id']}/stock/reserve", json={"size": "M", "quantity": 4}, headers=auth)
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Insufficient stock"
+    assert stored(product["id"])["stock"]["M"] == 3
+
+def test_reserve_unknown_product_or_size_is_404(client, auth, make_product):
+    product = make_product()
+    response = client.post(f"/api/products/{product['id']}/stock/reserve", json={"size": "XL", "quantity": 1}, headers=auth)
+    assert response.status_code == 404
+    response = client.post("/api/products/missing/stock/reserve", json={"size": "S", "quantity": 1}, headers=auth)
+    assert response.status_code == 404
+
+def test_reserve_rejects_sizes_outside_the_stock_map(client, auth, make_product):
+    product = make_product()
+    response = client.post(f"/api/products/{product['id']}/stock/reserve", json={"size": "S.x", "quantity": 1}, headers=auth)
+    assert response.status_code == 400
+
+def test_release_returns_units(client, auth, make_product, stored):
+    product = make_product()
+    response = client.post(f"/api/products/{product['id']}/stock/release", json={"size": "M", "quantity": 2}, headers=auth)
+    assert response.status_code == 200
+    assert stored(product["id"])["stock"]["M"] == 5
+
+def test_batch_reserves_every_line(client, auth, make_product, stored):
+    first = make_product()
+    second = make_product(name="Blusa Prueba", category="blusas")
+    response = client.post("/api/stock/reserve", json={"lines": [
+        {"product_id": first["id"], "size": "S", "quantity": 1},
+        {"product_id": second["id"], "size": "M", "quantity": 1},
+    ]}, headers=auth)
+    assert response.status_code == 200
+    assert stored(first["id"])["stock"]["S"] == 4
+    assert stored(second["id"])["stock"]["M"] == 2
+
+def test_batch_merges_repeated_lines_before_checking(client, auth, make_product, stored):
+    product = make_product()
+    response = client.post("/api/stock/reserve", json={"lines": [
+        {"product_id": product["id"], "size": "M", "quantity": 2},
+        {"product_id": product["id"], "size": "M", "quantity": 2},
+    ]}, headers=auth)
+    assert response.status_code == 409
+    assert stored(product["id"])["stock"]["M"] == 3
+
+def test_batch_rolls_back_reserved_lines_on_failure(client, auth, make_product, stored):
+    first = make_product()
+    second = make_product(name="Blusa Prueba", category="blusas")
+    response = client.post("/api/stock/reserve", json={"lines": [
+        {"product_id": first["id"], "size": "S", "quantity": 2},
+        {"product_id": second["id"], "size": "M", "quantity": 10},
+    ]}, headers=auth)
+    assert response.status_code == 409
+    detail = response.json()["detail"]
+    assert [line["product_id"] for line in detail["lines"]] == [second["id"]]
+    assert detail["lines"][0]["reason"] == "Insufficient stock"
+    assert detail["unrestored"] == []
+    assert stored(first["id"])["stock"]["S"] == 5
+    assert stored(second["id"])["stock"]["M"] == 3
+
+def test_batch_reports_lines_the_rollback_could_not_restore(client, auth, make_product, stored, monkeypatch):
+    product = make_product()
+    collection_type = type(server.db.products)
+    async def failing_bulk_write(self, *args, **kwargs):
+        raise AutoReconnect("primary stepped down")
+    monkeypatch.setattr(collection_type, "bulk_write", failing_bulk_write)
+    response = client.post("/api/stock/reserve", json={"lines": [
+        {"product_id": product["id"], "size": "S", "quantity": 1},
+        {"product_id": "missing", "size": "S", "quantity": 1},
+    ]}, headers=auth)
+    assert response.status_code == 409
+    detail = response.json()["detail"]
+    assert detail["lines"][0]["reason"] == "Product not found"
+    assert detail["unrestored"] == [{"product_id": product["id"], "size": "S", "quantity": 1}]
+    assert stored(product["id"])["stock"]["S"] == 4
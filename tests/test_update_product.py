@@ -0,0 +1,41 @@
+def test_update_returns_the_stored_product(client, auth, make_product, stored):
+    product = make_product()
+    response = client.put(f"/api/products/{product['id']}", json={"name": "Vestido Renombrado", "retail_price": 110000}, headers=auth)
+    assert response.status_code == 200
+    assert response.json()["name"] == "Vestido Renombrado"
+    assert response.json()["stock"] == {"S": 5, "M": 3}
+    document = stored(product["id"])
+    assert document["name_key"] == "vestido renombrado"
+    assert document["retail_price"] == 110000
+
+def test_update_price_guard_uses_the_stored_prices(client, auth, make_product, stored):
+    product = make_product()
+    response = client.put(f"/api/products/{product['id']}", json={"wholesale_price": 100000}, headers=auth)
+    assert response.status_code == 400
+    response = client.put(f"/api/products/{product['id']}", json={"retail_price": 70000}, headers=auth)
+    assert response.status_code == 400
+    assert stored(product["id"])["retail_price"] == 100000
+
+def test_update_validates_both_new_prices_together(client, auth, make_product):
+    product = make_product()
+    response = client.put(f"/api/products/{product['id']}", json={"retail_price": 50000, "wholesale_price": 40000}, headers=auth)
+    assert response.status_code == 200
+    response = client.put(f"/api/products/{product['id']}", json={"retail_price": 50000, "wholesale_price": 60000}, headers=auth)
+    assert response.status_code == 400
+
+def test_update_missing_product_is_404(client, auth):
+    response = client.put("/api/products/missing", json={"description": "x"}, headers=auth)
+    assert response.status_code == 404
+
+def test_update_rejects_duplicate_names(client, auth, make_product):
+    make_product()
+    other = make_product(name="Blusa Prueba", category="blusas")
+    response = client.put(f"/api/products/{other['id']}", json={"name": "VESTIDO prueba"}, headers=auth)
+    assert response.status_code == 400
+
+def test_update_is_visible_through_the_catalog_cache(client, auth, make_product):
+    product = make_product()
+    assert client.get(f"/api/products/{product['id']}").json()["description"] == "Vestido de prueba"
+    client.put(f"/api/products/{product['id']}", json={"description": "Cambiada"}, headers=auth)
+    assert client.get(f"/api/products/{product['id']}").json()["description"] == "Cambiada"
+    assert client.get("/api/products").json()[0]["description"] == "Cambiada"